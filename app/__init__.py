@@ -1,15 +1,38 @@
 import os
+import json
 from flask import Flask, render_template
-from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail
-from celery import Celery
+from app.metrics import init_metrics
+from app.database import Database
+from app.lazy import LazyMail
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-db = SQLAlchemy()
-mail = Mail()
-celery = Celery()
+db = Database()
+mail = LazyMail()
+_celery = None
 
-def create_app():
+# FLASK_* variables read by the flask command itself rather than the app
+CLI_VARIABLES = ("FLASK_APP", "FLASK_ENV", "FLASK_RUN_HOST", "FLASK_RUN_PORT", "FLASK_RUN_CERT", "FLASK_RUN_KEY",
+                 "FLASK_RUN_EXTRA_FILES", "FLASK_SKIP_DOTENV")
+
+def environ_config(defaults, environ=os.environ):
+    """Config overrides from FLASK_<KEY> environment variables. Values are parsed as JSON
+    unless the default is a string, so FLASK_DEBUG=false and FLASK_SQLITE_POOL_SIZE=10 work."""
+    config = {}
+    for name, value in environ.items():
+        if not name.startswith("FLASK_") or name in CLI_VARIABLES:
+            continue
+        key = name[len("FLASK_"):]
+        if isinstance(defaults.get(key), str):
+            config[key] = value
+            continue
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+def create_app(config=None):
+    """Builds the app from the defaults below, then `config`, then FLASK_* environment variables."""
     app = Flask(__name__)
     app.config.from_mapping(
         SECRET_KEY=os.getenv("FLASK_SECRET_KEY") or 'prc9FWjeLYh_KsPGm0vJcg',
@@ -19,28 +42,124 @@ def create_app():
         MAIL_SERVER="127.0.0.1",
         MAIL_PORT=1025,    
         CELERY_BROKER_URL="redis://127.0.0.1:6370/0",        
-        SEND_MAILS_WITH_CELERY=True
+        SEND_MAILS_WITH_CELERY=True,
+        MAIL_DISPATCH=None,
+        MAIL_OUTBOX_BATCH_SIZE=100,
+        MAIL_OUTBOX_MAX_ATTEMPTS=8,
+        MAIL_OUTBOX_BACKOFF_SECONDS=30,
+        MAIL_OUTBOX_MAX_BACKOFF_SECONDS=60*60,
+        MAIL_OUTBOX_LEASE_SECONDS=5*60,
+        MAIL_THREAD_WORKERS=2,
+        MAIL_THREAD_QUEUE_SIZE=100,
+        MAIL_THREAD_SUBMIT_TIMEOUT=1.0,
+        FEED_PER_PAGE=24,
+        API_MAX_PER_PAGE=100,
+        IMPORT_BATCH_SIZE=1000, # imported gigs inserted per transaction
+        ANALYTICS_DAYS=14, # days of applicants on the employer dashboard
+        RECOMMEND_FEED_SIZE=6, # gigs recommended above a musician's feed, 0 turns recommendations off
+        RECOMMEND_SYNC_SECONDS=5,
+        RECOMMEND_PRELOAD=False, # build the index in the gunicorn master before forking workers
+        ASSETS_FINGERPRINT=True,
+        ASSETS_MAX_AGE=365*24*60*60,
+        COMPRESS_ENABLED=True,
+        COMPRESS_ALGORITHMS=("br", "gzip"),
+        COMPRESS_LEVEL=6,
+        COMPRESS_BR_QUALITY=4,
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_MIMETYPES=("text/html", "text/css", "text/plain", "text/csv", "application/javascript", "application/json",
+                            "image/svg+xml"),
+        FACET_CACHE_SECONDS=60,
+        METRICS_ENABLED=True,
+        METRICS_SERVER_TIMING=False,
+        FRAGMENT_CACHE_BACKEND="memory",
+        FRAGMENT_CACHE_SIZE=10000,
+        FRAGMENT_CACHE_REDIS_URL="redis://127.0.0.1:6370/1",
+        FRAGMENT_CACHE_TIMEOUT=24*60*60,
+        CURRENT_USER_CACHE_BACKEND="memory",
+        CURRENT_USER_CACHE_SIZE=10000,
+        CURRENT_USER_CACHE_SECONDS=5*60,
+        CURRENT_USER_CACHE_REDIS_URL="redis://127.0.0.1:6370/2",
+        SQLITE_PROFILE=None,
+        SQLITE_PRAGMAS={},
+        SQLITE_POOL_SIZE=5,
+        SQLITE_POOL_OVERFLOW=10,
+        SQLITE_READ_ONLY_ROUTING=True,
+        PROXY_COUNT=0, # reverse proxies in front of the app trusted for X-Forwarded-For/-Proto, applied by wsgi.py
+        RATELIMIT_ENABLED=True,
+        RATELIMIT_BACKEND="memory",
+        RATELIMIT_MEMORY_SIZE=100000,
+        RATELIMIT_SQLITE_PATH=os.path.join(basedir, "ratelimit.sqlite"),
+        RATELIMIT_REDIS_URL="redis://127.0.0.1:6370/3",
+        RATELIMIT_IP=(30, 60), # attempts per seconds, per client IP and endpoint
+        RATELIMIT_EMAIL=(10, 60) # per email address and endpoint
     )
 
+    app.config.update(config or {})
+    app.config.update(environ_config(app.config))
+
     db.init_app(app)
     mail.init_app(app)
-    init_celery(app)
+    init_metrics(app)
+
+    from app.fragments import fragment_cache
+    fragment_cache.init_app(app)
+    from app.auth.cache import user_cache
+    user_cache.init_app(app)
+    from app.assets import assets
+    assets.init_app(app)
+    from app.auth.ratelimit import limiter
+    limiter.init_app(app)
+    from app.recommend import recommender
+    recommender.init_app(app)
+    from app.compression import compress_responses
+    compress_responses.init_app(app)
     
     from app.auth.views import auth
     from app.main.views import main
     from app.account.views import account
     from app.gig.views import gig
+    from app.api.views import api
     app.register_blueprint(auth)
     app.register_blueprint(main)
     app.register_blueprint(account, url_prefix="/user")
     app.register_blueprint(gig, url_prefix="/gig")
+    app.register_blueprint(api, url_prefix="/api")
 
     from app.main.errors import page_not_found
     app.register_error_handler(404, page_not_found)
 
+    from app.seed import seed_command
+    app.cli.add_command(seed_command)
+    from app.gig.search import search_index_command
+    app.cli.add_command(search_index_command)
+    from app.emails import flush_outbox_command
+    app.cli.add_command(flush_outbox_command)
+    from app.counters import reconcile_counters_command
+    app.cli.add_command(reconcile_counters_command)
+    from app.analytics import rebuild_analytics_command
+    app.cli.add_command(rebuild_analytics_command)
+    from app.recommend import recommend_command
+    app.cli.add_command(recommend_command)
+    from app.gig.imports import import_gigs_command
+    app.cli.add_command(import_gigs_command)
+    from app.schema import upgrade_applications_command
+    app.cli.add_command(upgrade_applications_command)
+    from app.assets import build_assets_command
+    app.cli.add_command(build_assets_command)
+
     return app
 
-def init_celery(app):
+def get_celery(app):
+    """The Celery app, created on first use so processes that never queue a mail don't import Celery."""
+    global _celery
+    if _celery is None:
+        from celery import Celery
+        _celery = init_celery(Celery(), app)
+        from app.emails import register_tasks
+        register_tasks(_celery)
+    return _celery
+
+def init_celery(celery, app):
     celery.conf.broker_url = app.config["CELERY_BROKER_URL"]
     
     class ContextTask(celery.Task):
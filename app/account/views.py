@@ -4,14 +4,17 @@ from app.models import User, Role, Gig
 from app import db
 from werkzeug.utils import escape, unescape
 from app.account.forms import UpdateAccountForm
+from app.loaders import load
+from app.database import read_only
 
 account = Blueprint("account", __name__, template_folder="templates") 
 
 @account.route("/profile/<username>")
+@read_only
 @login_required
 @activation_required
 def show(username):
-    user = User.query.filter_by(username=username).first()
+    user = load(User, username=username)
     gigs = None
     if user.is_role(Role.EMPLOYER):
         gigs = user.gigs.all()
@@ -0,0 +1,98 @@
+import click
+from datetime import datetime, timedelta
+from flask.cli import with_appcontext
+from app import db
+from app.pagination import keyset_paginate
+from app.models import Gig, applications, gig_daily_applicants, location_payments, employer_stats, SUMMARY_TABLES
+
+gigs = Gig.__table__
+
+def create_analytics_schema():
+    """Creates the summary tables and the applications date column on databases that predate them."""
+    engine = db.get_engine()
+    if "applied_at" not in {column["name"] for column in db.inspect(engine).get_columns("applications")}:
+        db.session.execute(db.text("ALTER TABLE applications ADD COLUMN applied_at DATETIME"))
+        db.session.commit()
+    for table in SUMMARY_TABLES:
+        table.create(engine, checkfirst=True)
+
+def summary_queries():
+    """Every summary table with the aggregate it holds."""
+    day = db.func.date(applications.c.applied_at)
+    per_gig = db.select([applications.c.gig_id, db.func.count().label("applicants")]).group_by(applications.c.gig_id).alias()
+    return [
+        (gig_daily_applicants, db.select([applications.c.gig_id, day, gigs.c.employer_id, db.func.count()])
+            .select_from(applications.join(gigs, gigs.c.id == applications.c.gig_id))
+            .where(applications.c.applied_at.isnot(None))
+            .group_by(applications.c.gig_id, day, gigs.c.employer_id)),
+        (location_payments, db.select([gigs.c.location, db.func.count(), db.func.sum(gigs.c.payment)])
+            .where(db.and_(gigs.c.location.isnot(None), gigs.c.payment.isnot(None)))
+            .group_by(gigs.c.location)),
+        (employer_stats, db.select([gigs.c.employer_id, db.func.coalesce(db.func.sum(gigs.c.payment), 0),
+                                    db.func.coalesce(db.func.sum(per_gig.c.applicants), 0)])
+            .select_from(gigs.outerjoin(per_gig, per_gig.c.gig_id == gigs.c.id))
+            .group_by(gigs.c.employer_id)),
+    ]
+
+def rebuild_analytics():
+    """Recomputes every summary table with one INSERT ... SELECT each, in a single transaction.
+    Returns the rows written per table."""
+    rebuilt = {}
+    for table, rows in summary_queries():
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select([column.name for column in table.c], rows))
+        rebuilt[table.name] = db.session.execute(db.select([db.func.count()]).select_from(table)).scalar()
+    db.session.commit()
+    return rebuilt
+
+def employer_dashboard(employer, days, per_page=None):
+    """A page of the employer's gigs with applicants per day over the last `days` days and the average
+    payment of the other gigs in the same location, all read from the summary tables. Paginated like
+    the feed, as bulk imports leave employers with many thousands of gigs."""
+    today = datetime.utcnow().date()
+    dates = [today - timedelta(days=offset) for offset in reversed(range(days))]
+    page = keyset_paginate(employer.gigs, Gig.id, per_page)
+    gig_list = page.items
+
+    totals = db.session.execute(db.select([employer_stats.c.payment_total, employer_stats.c.applicant_count])
+                                .where(employer_stats.c.employer_id == employer.id)).first()
+    payments = {}
+    locations = {gig.location for gig in gig_list if gig.location is not None}
+    if locations:
+        for location, count, total in db.session.execute(
+                db.select([location_payments.c.location, location_payments.c.gig_count, location_payments.c.payment_total])
+                .where(location_payments.c.location.in_(locations))):
+            payments[location] = (count, total)
+    daily = {}
+    for gig_id, day, applicants in db.session.execute(
+            db.select([gig_daily_applicants.c.gig_id, gig_daily_applicants.c.day, gig_daily_applicants.c.applicants])
+            .where(db.and_(gig_daily_applicants.c.gig_id.in_([gig.id for gig in gig_list]), gig_daily_applicants.c.day >= dates[0]))):
+        daily[gig_id, day] = applicants
+
+    rows = []
+    for gig in gig_list:
+        count, total = payments.get(gig.location, (0, 0))
+        if gig.payment is not None and count:
+            count, total = count - 1, total - gig.payment # compared with the other gigs only
+        rows.append({
+            "gig": gig,
+            "applicants": [daily.get((gig.id, day), 0) for day in dates],
+            "location_gigs": count,
+            "location_average": total / count if count else None,
+        })
+    return {
+        "rows": rows,
+        "page": page,
+        "gig_count": employer.gig_count,
+        "dates": dates,
+        "total_spend": totals.payment_total if totals else 0,
+        "total_applicants": totals.applicant_count if totals else 0,
+    }
+
+@click.command("rebuild-analytics")
+@with_appcontext
+def rebuild_analytics_command():
+    """Recompute the employer analytics summary tables."""
+    create_analytics_schema()
+    for table, rows in rebuild_analytics().items():
+        print("%s: %d rows" % (table, rows))
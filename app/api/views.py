@@ -0,0 +1,178 @@
+import hashlib
+from functools import wraps
+import json
+from flask import Blueprint, jsonify, request, abort, current_app, stream_with_context
+from werkzeug.exceptions import BadRequest
+from app.auth.views import current_user
+from app import db
+from app.models import User, Role, Gig
+from app.pagination import keyset_paginate
+from app.gig.forms import GigFilterForm
+from app.gig.filters import GigFilters
+from app.gig.imports import import_gigs
+from app.loaders import load
+from app.database import read_only
+
+api = Blueprint("api", __name__)
+
+# Serializable fields per resource, `?fields=title,payment` picks a subset
+GIG_FIELDS = {
+    "id": lambda gig: gig.id,
+    "slug": lambda gig: gig.slug,
+    "title": lambda gig: gig.title,
+    "description": lambda gig: gig.description,
+    "payment": lambda gig: gig.payment,
+    "location": lambda gig: gig.location,
+    "employer": lambda gig: gig.employer.username,
+    "applicant_count": lambda gig: gig.applicant_count,
+    "version": lambda gig: gig.version
+}
+MUSICIAN_FIELDS = {
+    "id": lambda user: user.id,
+    "username": lambda user: user.username,
+    "location": lambda user: user.location,
+    "description": lambda user: user.description,
+    "application_count": lambda user: user.application_count,
+    "version": lambda user: user.version
+}
+
+# Everything a representation depends on: the row versions and the counters, which change without a version bump
+def gig_key(gig):
+    return (gig.id, gig.version, gig.applicant_count, gig.employer.id, gig.employer.version)
+
+def musician_key(user):
+    return (user.id, user.version, user.application_count)
+
+def api_login_required(f):
+    @wraps(f)
+    def _api_login_required(*args, **kwargs):
+        if current_user.is_anonymous():
+            abort(401, "Authentication required")
+        if not current_user.is_active():
+            abort(403, "Only activated users have access to the API")
+        return f(*args, **kwargs)
+    return _api_login_required
+
+def selected_fields(available):
+    requested = [name.strip() for name in request.args.get("fields", "").split(",") if name.strip()]
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        abort(400, "Unknown fields: " + ", ".join(unknown))
+    return tuple(requested) or tuple(available)
+
+def invalid_parameters(errors):
+    """400 listing the errors per query parameter, answered by api_error."""
+    error = BadRequest("Invalid query parameters")
+    error.errors = errors
+    raise error
+
+def per_page():
+    try:
+        limit = int(request.args.get("limit", current_app.config["FEED_PER_PAGE"]))
+    except ValueError:
+        invalid_parameters({"limit": ["Not a valid integer"]})
+    return max(1, min(limit, current_app.config["API_MAX_PER_PAGE"]))
+
+def serialize(item, serializers, fields):
+    return {name: serializers[name](item) for name in fields}
+
+def conditional(etag_parts, build):
+    """Answers 304 when the client holds the representation identified by `etag_parts`, otherwise builds and sends it."""
+    etag = hashlib.sha1(repr(etag_parts).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag): # If-None-Match compares weakly, compressed responses carry W/ tags
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache" # always revalidate, a 304 is cheap
+    return response
+
+def paginated(page, serializers, fields, key):
+    etag_parts = (request.path, fields, page.has_prev, page.has_next, [key(item) for item in page])
+    return conditional(etag_parts, lambda: {
+        "items": [serialize(item, serializers, fields) for item in page],
+        "prev_cursor": page.prev_cursor,
+        "next_cursor": page.next_cursor
+    })
+
+@api.route("/gigs")
+@read_only
+@api_login_required
+def gigs():
+    fields  = selected_fields(GIG_FIELDS)
+    filters = GigFilters(GigFilterForm(request.args))
+    if filters.errors:
+        invalid_parameters(filters.errors)
+    page    = keyset_paginate(filters.apply(Gig.query.options(db.joinedload(Gig.employer))), Gig.id, per_page(), invalid_parameters)
+    return paginated(page, GIG_FIELDS, fields, gig_key)
+
+# Request body types of a gig import. Not ones a form can send, so a cross site page can't post an import.
+IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl"
+}
+
+@api.route("/gigs/import", methods=["POST"])
+@api_login_required
+def import_gig_file():
+    """Imports the gigs of a CSV or JSON lines request body, streaming back one JSON line per rejected
+    row and a summary line."""
+    if not current_user.is_role(Role.EMPLOYER):
+        abort(403, "Only employers can import gigs")
+    format = IMPORT_FORMATS.get(request.mimetype)
+    if format is None:
+        abort(415, "Send the gigs as " + " or ".join(IMPORT_FORMATS))
+    reports = import_gigs(request.stream, current_user.id, format)
+    return current_app.response_class(stream_with_context(json.dumps(report) + "\n" for report in reports),
+                                      mimetype="application/x-ndjson")
+
+@api.route("/gigs/<slug>")
+@read_only
+@api_login_required
+def gig(slug):
+    fields = selected_fields(GIG_FIELDS)
+    gig = Gig.query.options(db.joinedload(Gig.employer)).filter_by(slug=slug).first()
+    if not gig:
+        abort(404, "Gig not found")
+    return conditional((request.path, fields, gig_key(gig)), lambda: serialize(gig, GIG_FIELDS, fields))
+
+@api.route("/gigs/<slug>/applicants")
+@read_only
+@api_login_required
+def applicants(slug):
+    fields = selected_fields(MUSICIAN_FIELDS)
+    gig = load(Gig, slug=slug)
+    if not gig:
+        abort(404, "Gig not found")
+    page = keyset_paginate(gig.musicians, User.id, per_page(), invalid_parameters)
+    return paginated(page, MUSICIAN_FIELDS, fields, musician_key)
+
+@api.route("/musicians")
+@read_only
+@api_login_required
+def musicians():
+    fields = selected_fields(MUSICIAN_FIELDS)
+    page = keyset_paginate(User.query.filter_by(role_id=Role.MUSICIAN), User.id, per_page(), invalid_parameters)
+    return paginated(page, MUSICIAN_FIELDS, fields, musician_key)
+
+@api.route("/musicians/<username>")
+@read_only
+@api_login_required
+def musician(username):
+    fields = selected_fields(MUSICIAN_FIELDS)
+    user = load(User, username=username)
+    if not user or not user.is_role(Role.MUSICIAN):
+        abort(404, "Musician not found")
+    return conditional((request.path, fields, musician_key(user)), lambda: serialize(user, MUSICIAN_FIELDS, fields))
+
+@api.errorhandler(400)
+@api.errorhandler(401)
+@api.errorhandler(403)
+@api.errorhandler(404)
+@api.errorhandler(415)
+def api_error(e):
+    body = {"error": e.description}
+    if getattr(e, "errors", None):
+        body["errors"] = e.errors
+    return jsonify(body), e.code
@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+BUILD_DIR      = "dist"
+MANIFEST       = "manifest.json"
+COMPRESSIBLE   = (".css", ".js", ".svg", ".json", ".txt", ".map") # images are already compressed
+ENCODINGS      = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [name for name in dirs if os.path.join(root, name) != os.path.join(static_folder, BUILD_DIR)]
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_folder).replace(os.sep, "/"), path
+
+def _fingerprint(filename, content):
+    base, extension = os.path.splitext(filename)
+    return "%s/%s.%s%s" % (BUILD_DIR, base, hashlib.sha256(content).hexdigest()[:12], extension)
+
+def _compress(encoding, content):
+    if encoding == "gzip":
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(content, quality=11)
+
+def build_assets(static_folder):
+    """Copies every static file to a content hashed name under static/dist, writes gzip and
+    brotli variants of text assets and records both in a manifest. Returns the manifest."""
+    manifest = {}
+    for filename, path in _source_files(static_folder):
+        with open(path, "rb") as f:
+            content = f.read()
+        hashed = _fingerprint(filename, content)
+        target = os.path.join(static_folder, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        encodings = []
+        if filename.endswith(COMPRESSIBLE):
+            for encoding, suffix in ENCODINGS:
+                compressed = _compress(encoding, content)
+                if compressed is not None and len(compressed) < len(content):
+                    with open(target + suffix, "wb") as f:
+                        f.write(compressed)
+                    encodings.append(encoding)
+        stat = os.stat(path)
+        manifest[filename] = {"path": hashed, "encodings": encodings, "size": stat.st_size, "mtime": stat.st_mtime}
+    with open(os.path.join(static_folder, BUILD_DIR, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets():
+    """Points url_for('static') at fingerprinted files and serves them precompressed with immutable cache headers."""
+
+    def __init__(self, app=None):
+        self.manifest  = {}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.manifest, self.encodings = {}, {}
+        if app.config["ASSETS_FINGERPRINT"]:
+            self.load_manifest(app.static_folder)
+        app.url_defaults(self.fingerprint)
+        app.view_functions["static"] = self.send_static_file
+
+    def load_manifest(self, static_folder):
+        try:
+            with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        for filename, entry in manifest.items():
+            # files edited since the last build are served as they are rather than stale
+            try:
+                stat = os.stat(os.path.join(static_folder, filename))
+            except OSError:
+                continue
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                self.manifest[filename] = entry["path"]
+                self.encodings[entry["path"]] = entry["encodings"]
+
+    def fingerprint(self, endpoint, values):
+        if endpoint == "static":
+            hashed = self.manifest.get(values.get("filename"))
+            if hashed is not None:
+                values["filename"] = hashed
+
+    def send_static_file(self, filename):
+        encodings = self.encodings.get(filename)
+        if encodings is None:
+            return current_app.send_static_file(filename)
+
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and accepted[encoding]:
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response = send_from_directory(current_app.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, filename)
+        if encodings:
+            response.vary.add("Accept-Encoding")
+        # the name changes with the content, so the file can be cached forever
+        response.cache_control.public  = True
+        response.cache_control.max_age = current_app.config["ASSETS_MAX_AGE"]
+        response.cache_control.immutable = True
+        return response
+
+assets = Assets()
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the static files."""
+    manifest = build_assets(current_app.static_folder)
+    compressed = sum(1 for entry in manifest.values() if entry["encodings"])
+    print("Built %d assets, %d precompressed" % (len(manifest), compressed))
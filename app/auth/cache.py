@@ -0,0 +1,97 @@
+import json
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from app.models import User
+from app.loaders import load
+from app.fragments import MemoryBackend, RedisBackend
+from app.metrics import registry
+
+# Only what login_required, role_required, activation_required and the templates read on every page.
+CACHED_FIELDS = ("id", "username", "role_id", "activated")
+
+class UserCache():
+    """Cross-request cache of the current user's hot fields, so most page views run no auth query."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.timeout = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.timeout = app.config["CURRENT_USER_CACHE_SECONDS"]
+        backend = app.config["CURRENT_USER_CACHE_BACKEND"]
+        if not self.timeout or backend is None:
+            self.backend = None
+        elif backend == "memory":
+            self.backend = MemoryBackend(app.config["CURRENT_USER_CACHE_SIZE"])
+        elif backend == "redis":
+            self.backend = RedisBackend(app.config["CURRENT_USER_CACHE_REDIS_URL"], self.timeout, prefix="current-user:")
+        else:
+            self.backend = backend
+
+    def get(self, user_id):
+        if self.backend is None:
+            return None
+        cached = self.backend.get(str(user_id))
+        if cached is None:
+            registry.inc("current_user_cache_misses_total", help_text="Current user cache misses")
+            return None
+        fields = json.loads(cached)
+        if fields.pop("expires_at") < time.time():
+            self.backend.delete(str(user_id))
+            registry.inc("current_user_cache_misses_total", help_text="Current user cache misses")
+            return None
+        registry.inc("current_user_cache_hits_total", help_text="Current user cache hits")
+        return fields
+
+    def set(self, user):
+        if self.backend is None:
+            return
+        fields = {field: getattr(user, field) for field in CACHED_FIELDS}
+        fields["expires_at"] = time.time() + self.timeout
+        self.backend.set(str(user.id), json.dumps(fields))
+
+    def delete(self, user_id):
+        if self.backend is not None and user_id is not None:
+            self.backend.delete(str(user_id))
+
+user_cache = UserCache()
+
+def user_from_cache(fields):
+    """Builds a persistent User from cached fields without a query, other columns load on first access."""
+    user = User.__mapper__.class_manager.new_instance()
+    for field, value in fields.items():
+        setattr(user, field, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+def load_user(user_id):
+    fields = user_cache.get(user_id)
+    if fields is not None:
+        return user_from_cache(fields)
+    user = load(User, id=user_id)
+    if user is not None:
+        user_cache.set(user)
+    return user
+
+# account.edit, account.delete, activate_account and password changes all flush the user row. The cache
+# is cleared once the change is committed: cleared at flush, a concurrent request could cache the old
+# row again before the commit.
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def mark_cached_user(mapper, connection, target):
+    session = db.inspect(target).session
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_cached_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        user_cache.delete(user_id)
+
+@event.listens_for(db.session, "after_rollback")
+def forget_changed_users(session):
+    session.info.pop("changed_user_ids", None)
@@ -3,10 +3,11 @@ from wtforms.fields import StringField, PasswordField, SubmitField, BooleanField
 from wtforms.fields.html5 import EmailField
 from wtforms.validators import InputRequired, DataRequired, EqualTo, Length, ValidationError, Email
 from app.models import User
+from app.loaders import load, prefetch
 
 
 def user_exists_with_email(form, field):
-    user = User.query.filter_by(email=field.data).first()
+    user = load(User, email=field.data)
     if not user:
         raise ValidationError("There is no registered account with this email...")
 
@@ -34,12 +35,14 @@ class RegistrationForm(FlaskForm):
     submit           = SubmitField("Register")
 
     def validate_username(form, field):
-        user = User.query.filter_by(username=field.data).first()
+        prefetch(User, username=form.username.data, email=form.email.data) # one query answers both validators
+        user = load(User, username=field.data)
         if user:
             raise ValidationError("Username already exists.")
 
     def validate_email(form, field):
-        user = User.query.filter_by(email=field.data).first()
+        prefetch(User, username=form.username.data, email=form.email.data)
+        user = load(User, email=field.data)
         if user:
             raise ValidationError("Email already exists.")
 
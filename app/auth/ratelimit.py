@@ -0,0 +1,170 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, render_template
+from app.metrics import registry
+
+# Token buckets in front of the endpoints that hash passwords or tokens. Every attempt takes a token
+# from the client IP's bucket and from the target email's bucket, buckets refill continuously, and
+# an empty bucket answers 429 before the form is validated, so no user lookup or PBKDF2 runs.
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + max(now - updated, 0) * rate)
+
+def _take(tokens, capacity, rate):
+    """Returns (tokens left, seconds until the next token or 0 when the attempt is allowed)."""
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBuckets():
+    """Per-process buckets, an LRU bounds memory when attackers rotate keys."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets    = OrderedDict()
+        self._lock       = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, retry_after = _take(_refill(tokens, updated, capacity, rate, now), capacity, rate)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBuckets():
+    """Buckets in a local SQLite file, shared by every worker process on the host without running Redis."""
+
+    PURGE_EVERY = 1000 # takes between deletions of buckets idle for an hour, which are full anyway
+
+    def __init__(self, path):
+        self.path   = path
+        self._local = threading.local()
+        self._takes = 0
+        self._connection().execute("CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                                   "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+        return connection
+
+    def take(self, key, capacity, rate, now):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, retry_after = _take(_refill(tokens, updated, capacity, rate, now), capacity, rate)
+            connection.execute("INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            self._takes += 1
+            if self._takes % self.PURGE_EVERY == 0:
+                connection.execute("DELETE FROM rate_limit_buckets WHERE updated < ?", (now - 3600,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return retry_after
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rate_limit_buckets")
+
+
+class RedisBuckets():
+    """Buckets shared by every host, each take is one atomic script call."""
+
+    SCRIPT = """
+    local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens, updated = tonumber(bucket[1]) or capacity, tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+    local retry_after = 0
+    if tokens >= 1 then tokens = tokens - 1 else retry_after = (1 - tokens) / rate end
+    redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    def __init__(self, url, prefix="rate-limit:"):
+        from redis import Redis
+        self.client  = Redis.from_url(url)
+        self.prefix  = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, rate, now):
+        return float(self._script(keys=[self.prefix + key], args=[capacity, rate, now]))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class RateLimiter():
+    def __init__(self, app=None):
+        self.backend = None
+        self.rules   = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config["RATELIMIT_BACKEND"]
+        if not app.config["RATELIMIT_ENABLED"] or backend is None:
+            self.backend = None
+        elif backend == "memory":
+            self.backend = MemoryBuckets(app.config["RATELIMIT_MEMORY_SIZE"])
+        elif backend == "sqlite":
+            self.backend = SQLiteBuckets(app.config["RATELIMIT_SQLITE_PATH"])
+        elif backend == "redis":
+            self.backend = RedisBuckets(app.config["RATELIMIT_REDIS_URL"])
+        else:
+            self.backend = backend # any object with take(key, capacity, rate, now)
+        # scope -> (attempts, seconds): a full bucket allows `attempts` at once, then one every seconds/attempts
+        self.rules = {"ip": app.config["RATELIMIT_IP"], "email": app.config["RATELIMIT_EMAIL"]}
+
+    def hit(self, **identifiers):
+        """Takes a token from each identifier's bucket in turn, returns the seconds to wait or 0.
+        A rejected attempt stops there, so a client throttled by IP can't drain a victim's email bucket."""
+        if self.backend is None:
+            return 0
+        now = time.time()
+        for scope, identifier in identifiers.items():
+            if not identifier:
+                continue
+            attempts, seconds = self.rules[scope]
+            retry_after = self.backend.take("%s:%s:%s" % (request.endpoint, scope, identifier), attempts, attempts / seconds, now)
+            if retry_after:
+                registry.inc("rate_limit_rejected_total", help_text="Attempts rejected by the auth rate limiter", scope=scope)
+                return retry_after
+        return 0
+
+limiter = RateLimiter()
+
+
+def rate_limited(methods=("POST",)):
+    """Limits attempts per client IP and per email, taken from the URL or the submitted form."""
+    def _rate_limited(f):
+        @wraps(f)
+        def __rate_limited(*args, **kwargs):
+            if request.method in methods:
+                email = (request.view_args.get("email") or request.form.get("email") or "").strip().lower()
+                retry_after = limiter.hit(ip=request.remote_addr, email=email)
+                if retry_after:
+                    return render_template("errors/429.html"), 429, {"Retry-After": str(math.ceil(retry_after))}
+            return f(*args, **kwargs)
+        return __rate_limited
+    return _rate_limited
@@ -6,6 +6,9 @@ from werkzeug.local import LocalProxy
 from itsdangerous.url_safe import URLSafeSerializer
 from functools import wraps
 from app.emails import send_activation_mail, send_password_reset_mail
+from app.loaders import load
+from app.auth.cache import load_user
+from app.auth.ratelimit import rate_limited
 from flask.ctx import has_request_context
 
 auth = Blueprint("auth", __name__, template_folder="templates")
@@ -42,13 +45,14 @@ def activation_required(f):
     return _activation_required    
 
 @auth.route('/login', methods=["GET", "POST"])
+@rate_limited()
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         email = form.email.data
         password = form.password.data
 
-        user = User.query.filter_by(email=email).first()
+        user = load(User, email=email)
 
         if user.check_password(password):
             flash("You are successfully loged in", "success")
@@ -67,6 +71,7 @@ def login():
     return render_template("login.html", form=form)
 
 @auth.route("/register", methods=["GET", "POST"])
+@rate_limited()
 def register():
     form = RegistrationForm()
 
@@ -84,8 +89,8 @@ def register():
         flash("You are registered", "success")
         login_user(user)
         user.create_token_for("activation")
-        db.session.commit()
         send_activation_mail(user)
+        db.session.commit()
         return redirect(url_for("main.home"))
 
     return render_template("register.html", form=form)
@@ -108,12 +113,13 @@ def send_activation():
     if current_user.is_active():
         return redirect(url_for("main.home"))
     current_user.create_token_for("activation")
-    db.session.commit()
     send_activation_mail(current_user)
+    db.session.commit()
     flash("New email has been sent. Please confirm your account", "success")
     return redirect(url_for("main.home"))         
 
 @auth.route("/password_reset", methods=["GET", "POST"])
+@rate_limited()
 def password_reset():
     if current_user.is_authenticated():
         return redirect(url_for("main.home"))
@@ -121,21 +127,22 @@ def password_reset():
     form = PasswordResetForm()
     if form.validate_on_submit():
         email = form.email.data
-        user  = User.query.filter_by(email=email).first()
+        user  = load(User, email=email)
         user.create_token_for("reset")
-        db.session.commit()
         send_password_reset_mail(user)
+        db.session.commit()
         flash("The password reset instructions are sent to your email", "success")
         return redirect(url_for("main.home"))
     
     return render_template("password_reset.html", form=form)
 
 @auth.route("/update_password/<token>/<email>", methods=["GET", "POST"])
+@rate_limited(methods=("GET", "POST")) # checking the reset token hashes on GET too
 def update_password(token, email):
     if current_user.is_authenticated():
         return redirect(url_for("main.home")) 
     
-    user = User.query.filter_by(email=email).first()
+    user = load(User, email=email)
     if not user or not user.check_reset_token(token):
         flash("The password reset link is not valid or it has expired", "danger")
         return redirect(url_for("main.home")) 
@@ -191,12 +198,12 @@ def get_current_user():
     _current_user = getattr(g, "_current_user", None)  # using g context to avoid extra calls to the DB; Memoization
     if _current_user is None:
         if session.get("user_id"):
-            user = User.query.get(session.get("user_id"))              
+            user = load_user(session.get("user_id"))            
             if user:
                 _current_user = g._current_user = user
         elif request.cookies.get("user_id"):
             decrypted_cookie = int(decrypt_cookie(request.cookies.get("user_id")))
-            user = User.query.get(decrypted_cookie)
+            user = load(User, id=decrypted_cookie)
             if user and user.check_remember_token(decrypt_cookie(request.cookies.get("remember_token"))):
                 login_user(user)
                 _current_user = g._current_user = user                
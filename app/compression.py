@@ -0,0 +1,102 @@
+import zlib
+from flask import request
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def gzip_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # wbits > 16 writes a gzip header
+
+class BrotliCompressor():
+    """Gives brotli the compress/flush interface of a zlib compressobj."""
+
+    def __init__(self, quality):
+        self._compressor = _brotli().Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        if mode == zlib.Z_FINISH:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def compress(encoding, data, level):
+    compressor = BrotliCompressor(level) if encoding == "br" else gzip_compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+def _stream(chunks, compressor, charset):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH) # keeps streamed pages progressive
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+class Compress():
+    """Compresses text responses with the best encoding the client accepts."""
+
+    def __init__(self, app=None):
+        self.levels = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size  = app.config["COMPRESS_MIN_SIZE"]
+        self.mimetypes = set(app.config["COMPRESS_MIMETYPES"])
+        # encoding -> level, in order of preference, brotli only when the package is installed
+        self.levels = {encoding: app.config["COMPRESS_BR_QUALITY"] if encoding == "br" else app.config["COMPRESS_LEVEL"]
+                       for encoding in app.config["COMPRESS_ALGORITHMS"] if encoding != "br" or _brotli() is not None}
+        if app.config["COMPRESS_ENABLED"]:
+            app.after_request(self.after_request)
+
+    def negotiate(self):
+        """The accepted encoding with the highest quality, ties go to the order of COMPRESS_ALGORITHMS."""
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for encoding in self.levels:
+            quality = accepted[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def after_request(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in self.mimetypes):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+        level = self.levels[encoding]
+
+        if response.is_streamed or response.direct_passthrough:
+            compressor = BrotliCompressor(level) if encoding == "br" else gzip_compressor(level)
+            response.response = _stream(response.response, compressor, response.charset)
+            response.direct_passthrough = False
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compress(encoding, data, level))
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True) # the bytes differ from the identity encoding
+        return response
+
+compress_responses = Compress()
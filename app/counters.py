@@ -0,0 +1,31 @@
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import Gig, User, applications
+
+gigs  = Gig.__table__
+users = User.__table__
+
+def counter_queries():
+    """Every denormalized counter with the correlated COUNT it has to match."""
+    return [
+        (gigs.c.applicant_count, db.select([db.func.count()]).where(applications.c.gig_id == gigs.c.id).as_scalar()),
+        (users.c.gig_count, db.select([db.func.count()]).where(gigs.c.employer_id == users.c.id).as_scalar()),
+        (users.c.application_count, db.select([db.func.count()]).where(applications.c.musician_id == users.c.id).as_scalar()),
+    ]
+
+def reconcile_counters():
+    """Rewrites the counters that drifted from the real counts, returns the repaired rows per counter."""
+    repaired = {}
+    for column, actual in counter_queries():
+        result = db.session.execute(column.table.update().where(column != actual).values({column.name: actual}))
+        repaired[str(column)] = result.rowcount
+    db.session.commit()
+    return repaired
+
+@click.command("reconcile-counters")
+@with_appcontext
+def reconcile_counters_command():
+    """Recount applicants, gigs and applications and repair drifted counters."""
+    for counter, rows in reconcile_counters().items():
+        print("%s: %d rows repaired" % (counter, rows))
@@ -0,0 +1,105 @@
+from functools import wraps, partial
+from threading import Lock
+from urllib.parse import quote
+import sqlalchemy
+from flask import g, current_app, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+
+# WAL lets readers run next to the single writer, NORMAL is durable across application crashes in WAL mode,
+# busy_timeout waits for the write lock instead of failing with "database is locked".
+PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024, # negative means KiB
+    "temp_store": "MEMORY"
+}
+READ_ONLY_PRAGMAS = ("busy_timeout", "mmap_size", "cache_size", "temp_store") # journal mode is set by the writer
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute("PRAGMA %s = %s" % (name, value))
+    cursor.close()
+
+def _is_sqlite_file(sa_url):
+    return sa_url.drivername.startswith("sqlite") and sa_url.database not in (None, "", ":memory:")
+
+def read_only(f):
+    """Routes the view's queries to the read-only connection pool when SQLITE_READ_ONLY_ROUTING is on."""
+    @wraps(f)
+    def _read_only(*args, **kwargs):
+        g._read_only = True
+        return f(*args, **kwargs)
+    return _read_only
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self._db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_app_context() and g.get("_read_only"):
+            engine = self._db.get_read_engine(self.app)
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy with an SQLite production profile: tuned pragmas on every connection,
+    a real connection pool and an optional read-only pool for views that never write."""
+
+    def __init__(self, *args, **kwargs):
+        self._read_engines = {}
+        self._read_lock    = Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _profile(self, app):
+        return app.config["SQLITE_PROFILE"] == "production"
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        SQLAlchemy.apply_driver_hacks(self, app, sa_url, options)
+        if self._profile(app) and _is_sqlite_file(sa_url):
+            options["poolclass"]    = QueuePool
+            options["pool_size"]    = app.config["SQLITE_POOL_SIZE"]
+            options["max_overflow"] = app.config["SQLITE_POOL_OVERFLOW"]
+            options.setdefault("connect_args", {})["check_same_thread"] = False # a pooled connection is only used by one thread at a time
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = SQLAlchemy.create_engine(self, sa_url, engine_opts)
+        if self._profile(current_app) and _is_sqlite_file(sa_url):
+            pragmas = dict(PRODUCTION_PRAGMAS, **current_app.config["SQLITE_PRAGMAS"])
+            event.listen(engine, "connect", partial(_apply_pragmas, pragmas))
+        return engine
+
+    def get_read_engine(self, app):
+        if not (self._profile(app) and app.config["SQLITE_READ_ONLY_ROUTING"]):
+            return None
+        primary = self.get_engine(app)
+        if not _is_sqlite_file(primary.url):
+            return None
+        with self._read_lock:
+            engine = self._read_engines.get(primary)
+            if engine is None:
+                # quoted, sqlite would read a ?, # or % in the path as the start of the URI's query or an escape
+                uri     = "sqlite:///file:%s?mode=ro&uri=true" % quote(primary.url.database)
+                engine  = sqlalchemy.create_engine(uri, poolclass=QueuePool, pool_size=app.config["SQLITE_POOL_SIZE"],
+                                                   max_overflow=app.config["SQLITE_POOL_OVERFLOW"],
+                                                   connect_args={"check_same_thread": False})
+                pragmas = dict(PRODUCTION_PRAGMAS, **app.config["SQLITE_PRAGMAS"])
+                event.listen(engine, "connect", partial(_apply_pragmas, {name: pragmas[name] for name in READ_ONLY_PRAGMAS}))
+                self._read_engines[primary] = engine
+            return engine
+
+    def dispose(self, app):
+        """Drops every pooled connection, forked workers must open their own instead of sharing the parent's."""
+        self.get_engine(app).dispose()
+        with self._read_lock:
+            for engine in self._read_engines.values():
+                engine.dispose()
@@ -1,12 +1,30 @@
-from flask_mail import Message
-from app import mail, celery
-from flask import render_template, url_for, current_app
+import time
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import BoundedSemaphore, Lock
+from flask.cli import with_appcontext
+from app import db, mail, get_celery
+from app.models import OutboxMail
+from app.metrics import registry
+from flask import render_template, url_for, current_app, has_request_context, after_this_request
+
+SEND_MAIL_TASK = "app.emails.send_mail_with_celery"
 
-@celery.task
 def send_mail_with_celery(content):
     msg = create_message(content)
     mail.send(msg)
 
+def register_tasks(celery):
+    celery.task(name=SEND_MAIL_TASK)(send_mail_with_celery)
+
+def dispatch_mode():
+    """One of "sync", "celery", "outbox" or "thread", SEND_MAILS_WITH_CELERY picks between the first two when MAIL_DISPATCH is not set."""
+    mode = current_app.config["MAIL_DISPATCH"]
+    if mode is None:
+        mode = "celery" if current_app.config["SEND_MAILS_WITH_CELERY"] else "sync"
+    return mode
+
 def send_mail(to, subjec, template, **kwargs):
     content = {
         "subject": subjec,
@@ -16,13 +34,175 @@ def send_mail(to, subjec, template, **kwargs):
         "kwargs": kwargs
     }
     
-    if current_app.config["SEND_MAILS_WITH_CELERY"]:
-        send_mail_with_celery.delay(content) # send emails with celery
+    mode = dispatch_mode()
+    if mode == "outbox":
+        enqueue_mail(content) # committed together with the caller's transaction
+    elif mode == "celery":
+        get_celery(current_app._get_current_object()).tasks[SEND_MAIL_TASK].delay(content) # send emails with celery
+    elif mode == "thread":
+        mail_dispatcher.submit_after_request(content)
     else:
         msg = create_message(content)
         mail.send(msg)
+
+class MailDispatcher():
+    """Renders and sends mails on a bounded in-process thread pool, for when Celery and Redis are not around.
+
+    At most MAIL_THREAD_WORKERS + MAIL_THREAD_QUEUE_SIZE mails are in flight. When the pool is full,
+    submitting waits up to MAIL_THREAD_SUBMIT_TIMEOUT seconds and then drops the mail, logged and
+    counted, so a slow or unreachable mail server neither grows an unbounded queue nor fails requests
+    whose changes are already committed. Activation and reset mails can be asked for again."""
+
+    def __init__(self):
+        self._lock     = Lock()
+        self._executor = None
+        self._slots    = None
+        self.capacity  = 0
+        self.in_flight = 0
+
+    def _start(self, app):
+        with self._lock:
+            if self._executor is None: # started lazily so forked workers get their own threads
+                workers        = app.config["MAIL_THREAD_WORKERS"]
+                self.capacity  = workers + app.config["MAIL_THREAD_QUEUE_SIZE"]
+                self._slots    = BoundedSemaphore(self.capacity)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mail-dispatcher")
+
+    def submit_after_request(self, content):
+        if not has_request_context():
+            return self.submit(content)
+
+        @after_this_request
+        def _submit(response):
+            self.submit(content)
+            return response
+
+    def submit(self, content):
+        app = current_app._get_current_object()
+        self._start(app)
+        if not self._slots.acquire(timeout=app.config["MAIL_THREAD_SUBMIT_TIMEOUT"]):
+            registry.inc("mail_dispatch_dropped_total", help_text="Mails dropped because the dispatcher was full")
+            app.logger.error("Mail dispatcher full, dropped mail to %s", content["recipients"])
+            return None
+        with self._lock:
+            self.in_flight += 1
+        return self._executor.submit(self._send, app, content)
+
+    def _send(self, app, content):
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                mail.send(create_message(content))
+            registry.inc("mail_dispatch_sent_total", help_text="Mails sent by the in-process dispatcher")
+        except Exception:
+            registry.inc("mail_dispatch_failed_total", help_text="Mails the in-process dispatcher failed to send")
+            app.logger.exception("Could not send mail to %s", content["recipients"])
+        finally:
+            registry.observe("mail_dispatch_send_seconds", time.perf_counter() - started,
+                             help_text="Time to render and send one mail")
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def collect(self):
+        yield ("mail_dispatch_in_flight", "gauge", "Mails queued or being sent by the in-process dispatcher", {}, self.in_flight)
+        yield ("mail_dispatch_capacity", "gauge", "Mails the in-process dispatcher accepts before pushing back", {}, self.capacity)
+
+mail_dispatcher = MailDispatcher()
+registry.register_collector(mail_dispatcher.collect)
+
+def enqueue_mail(content):
+    msg = create_message(content)
+    outbox_mail = OutboxMail(msg.subject, msg.sender, msg.recipients, msg.body, msg.html)
+    db.session.add(outbox_mail)
+    return outbox_mail
+
+def _retry_delay(attempts):
+    base = current_app.config["MAIL_OUTBOX_BACKOFF_SECONDS"]
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), current_app.config["MAIL_OUTBOX_MAX_BACKOFF_SECONDS"]))
+
+def _claim_batch(batch_size, max_attempts):
+    """Leases due mails so a second flusher, or a crashed one, does not send them twice."""
+    now  = datetime.utcnow()
+    rows = db.session.query(OutboxMail.id).filter(OutboxMail.sent_at.is_(None), OutboxMail.next_attempt_at <= now,
+                                                  OutboxMail.attempts < max_attempts).order_by(OutboxMail.id).limit(batch_size).all()
+    ids  = [mail_id for mail_id, in rows]
+    if not ids:
+        return []
+    lease = now + timedelta(seconds=current_app.config["MAIL_OUTBOX_LEASE_SECONDS"])
+    OutboxMail.query.filter(OutboxMail.id.in_(ids), OutboxMail.next_attempt_at <= now) \
+        .update({OutboxMail.next_attempt_at: lease}, synchronize_session=False)
+    db.session.commit()
+    return OutboxMail.query.filter(OutboxMail.id.in_(ids), OutboxMail.next_attempt_at == lease).order_by(OutboxMail.id).all()
+
+def _mark_failed(outbox_mail, error):
+    outbox_mail.attempts       += 1
+    outbox_mail.last_error      = repr(error)
+    outbox_mail.next_attempt_at = datetime.utcnow() + _retry_delay(outbox_mail.attempts)
+
+def flush_outbox(batch_size=None, max_attempts=None):
+    """Sends due outbox mails in batches over one reused SMTP connection. Returns (sent, failed)."""
+    batch_size   = batch_size or current_app.config["MAIL_OUTBOX_BATCH_SIZE"]
+    max_attempts = max_attempts or current_app.config["MAIL_OUTBOX_MAX_ATTEMPTS"]
+    import smtplib
+    from flask_mail import Message
+    sent = failed = 0
+    while True:
+        batch = _claim_batch(batch_size, max_attempts)
+        if not batch:
+            return sent, failed
+        handled = set()
+        try:
+            with mail.connect() as connection:
+                for outbox_mail in batch:
+                    try:
+                        connection.send(Message(outbox_mail.subject, sender=outbox_mail.sender, recipients=outbox_mail.recipient_list(),
+                                                body=outbox_mail.body, html=outbox_mail.html))
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except smtplib.SMTPException as error:
+                        # a reply refusing this mail (recipient, sender, data), the connection is still good.
+                        # Checked before OSError, which SMTPException subclasses
+                        _mark_failed(outbox_mail, error)
+                        failed += 1
+                    except OSError:
+                        raise # the socket itself failed
+                    except Exception as error:
+                        _mark_failed(outbox_mail, error)
+                        failed += 1
+                    else:
+                        outbox_mail.sent_at = datetime.utcnow()
+                        sent += 1
+                    handled.add(outbox_mail.id)
+        except (smtplib.SMTPException, OSError) as error:
+            # connecting failed or the connection is gone, whatever was not handled yet is retried with backoff
+            for outbox_mail in batch:
+                if outbox_mail.id not in handled:
+                    _mark_failed(outbox_mail, error)
+                    failed += 1
+            db.session.commit()
+            return sent, failed
+        db.session.commit()
+
+@click.command("flush-outbox")
+@click.option("--loop", is_flag=True, help="Keep polling the outbox instead of exiting once it is drained.")
+@click.option("--interval", default=5.0, show_default=True, help="Seconds between polls with --loop.")
+@click.option("--batch-size", default=None, type=int, help="Mails sent per SMTP connection.")
+@with_appcontext
+def flush_outbox_command(loop, interval, batch_size):
+    """Deliver queued mails from the outbox table."""
+    while True:
+        started = time.perf_counter()
+        sent, failed = flush_outbox(batch_size)
+        elapsed = time.perf_counter() - started
+        if sent or failed:
+            print("Sent %d mails, %d failed, in %.2fs (%d mails/sec)" % (sent, failed, elapsed, sent / elapsed if elapsed else 0))
+        if not loop:
+            break
+        time.sleep(interval)
     
 def create_message(content):
+    from flask_mail import Message
     msg = Message(
         content["subject"],
         sender=content["sender"],
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import event, inspect, select
+from app.models import Gig, User
+from app.metrics import registry
+
+
+class MemoryBackend():
+    """Bounded in-process LRU."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries    = OrderedDict()
+        self._lock       = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend():
+    """Shared backend so every worker sees the same fragments and invalidations."""
+
+    def __init__(self, url, timeout=None, prefix="fragments:"):
+        from redis import Redis
+        self.client  = Redis.from_url(url)
+        self.timeout = timeout
+        self.prefix  = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode("utf-8"), ex=self.timeout)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class FragmentCache():
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config["FRAGMENT_CACHE_BACKEND"]
+        if backend == "memory":
+            self.backend = MemoryBackend(app.config["FRAGMENT_CACHE_SIZE"])
+        elif backend == "redis":
+            self.backend = RedisBackend(app.config["FRAGMENT_CACHE_REDIS_URL"], app.config["FRAGMENT_CACHE_TIMEOUT"])
+        elif backend is None:
+            self.backend = None
+        else:
+            self.backend = backend # any object with get/set/delete/clear
+        app.add_template_global(self.gig_card, "gig_card")
+
+    def fetch(self, key, render):
+        if self.backend is None:
+            return render()
+        fragment = self.backend.get(key)
+        if fragment is None:
+            registry.inc("fragment_cache_misses_total", help_text="Fragment cache misses")
+            fragment = render()
+            self.backend.set(key, fragment)
+        else:
+            registry.inc("fragment_cache_hits_total", help_text="Fragment cache hits")
+        return fragment
+
+    def delete(self, *keys):
+        if self.backend is not None:
+            self.backend.delete(*keys)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def gig_card(self, gig):
+        template = current_app.jinja_env.get_template("_gig_card.html")
+        return Markup(self.fetch(gig_card_key(gig.id, gig.version), lambda: template.render(gig=gig)))
+
+
+CARD_MARKUP_VERSION = 2 # part of the key, so shared backends don't serve cards rendered by an older template
+
+def gig_card_key(gig_id, version):
+    return "gig-card:%d:%d:%d" % (CARD_MARKUP_VERSION, gig_id, version)
+
+fragment_cache = FragmentCache()
+
+
+@event.listens_for(Gig, "after_update")
+def invalidate_updated_gig(mapper, connection, target):
+    # the version counter was already bumped, so drop the entry it replaced too
+    fragment_cache.delete(gig_card_key(target.id, target.version - 1), gig_card_key(target.id, target.version))
+
+@event.listens_for(Gig, "after_delete")
+def invalidate_deleted_gig(mapper, connection, target):
+    fragment_cache.delete(gig_card_key(target.id, target.version))
+
+@event.listens_for(User, "after_update")
+def invalidate_employer_gigs(mapper, connection, target):
+    # the employer's username is part of every card footer, deleted employers take their gigs with them
+    if not inspect(target).attrs.username.history.has_changes():
+        return
+    gigs = Gig.__table__
+    rows = connection.execute(select([gigs.c.id, gigs.c.version]).where(gigs.c.employer_id == target.id))
+    fragment_cache.delete(*[gig_card_key(gig_id, version) for gig_id, version in rows])
@@ -0,0 +1,110 @@
+import time
+from app import db
+from app.models import Gig, User
+from app.fragments import MemoryBackend
+
+PAYMENT_BUCKETS = (0, 250, 500, 1000, 2000) # lower bounds, the last bucket is open ended
+TOP_LOCATIONS   = 10
+
+_facet_cache = MemoryBackend(max_entries=512)
+
+class GigFilters():
+    """Filters of the gig listing, parsed from a validated GigFilterForm."""
+
+    def __init__(self, form):
+        valid = form.validate()
+        self.errors      = {} if valid else form.errors # the listing ignores invalid filters, the API rejects them
+        self.min_payment = form.min_payment.data if valid else None
+        self.max_payment = form.max_payment.data if valid else None
+        self.payment_under = form.payment_under.data if valid else None
+        self.location    = form.location.data if valid and form.location.data else None
+        self.employer    = form.employer.data if valid and form.employer.data else None
+        self._employer_id = None
+
+    @property
+    def active(self):
+        return any(value is not None for value in (self.min_payment, self.max_payment, self.payment_under, self.location, self.employer))
+
+    @property
+    def args(self):
+        """Query string arguments that reproduce the filters, kept by pagination links."""
+        args = dict(min_payment=self.min_payment, max_payment=self.max_payment, payment_under=self.payment_under,
+                    location=self.location, employer=self.employer)
+        return {key: value for key, value in args.items() if value is not None}
+
+    def employer_id(self):
+        if self.employer is not None and self._employer_id is None:
+            employer = db.session.query(User.id).filter_by(username=self.employer).first()
+            self._employer_id = employer.id if employer else 0 # 0 never matches, unknown employers give no gigs
+        return self._employer_id
+
+    def conditions(self, skip=()):
+        conditions = []
+        if self.min_payment is not None and "payment" not in skip:
+            conditions.append(Gig.payment >= self.min_payment)
+        if self.max_payment is not None and "payment" not in skip:
+            conditions.append(Gig.payment <= self.max_payment)
+        if self.payment_under is not None and "payment" not in skip:
+            conditions.append(Gig.payment < self.payment_under)
+        if self.location is not None and "location" not in skip:
+            conditions.append(Gig.location == self.location)
+        if self.employer is not None and "employer" not in skip:
+            conditions.append(Gig.employer_id == self.employer_id())
+        return conditions
+
+    def apply(self, query):
+        return query.filter(*self.conditions())
+
+def payment_bucket():
+    """Index of the [lower, next lower) range a payment is in. NULL for gigs without a payment or below
+    the first bound, which no bucket link could list."""
+    whens = [(Gig.payment >= lower, index) for index, lower in reversed(list(enumerate(PAYMENT_BUCKETS)))]
+    return db.case(whens, else_=None)
+
+def bucket_label(index):
+    if index + 1 < len(PAYMENT_BUCKETS):
+        return "$%d - $%d" % (PAYMENT_BUCKETS[index], PAYMENT_BUCKETS[index + 1])
+    return "$%d+" % PAYMENT_BUCKETS[index]
+
+def bucket_range(index):
+    """The bucket's lower bound and exclusive upper bound, the min_payment and payment_under of its link."""
+    upper = PAYMENT_BUCKETS[index + 1] if index + 1 < len(PAYMENT_BUCKETS) else None
+    return PAYMENT_BUCKETS[index], upper
+
+def gig_facets(filters):
+    """Gig counts per location and per payment bucket in one round trip.
+
+    Each facet is counted under every filter but its own, so picking a location
+    still shows how many gigs the other locations have."""
+    locations = db.select([db.literal("location").label("facet"), Gig.location.label("value"), db.func.count().label("gigs")]) \
+        .where(db.and_(*filter_or_true(filters.conditions(skip=("location",))))) \
+        .group_by(Gig.location).order_by(db.func.count().desc()).limit(TOP_LOCATIONS).alias("locations")
+    bucket = payment_bucket()
+    payments = db.select([db.literal("payment").label("facet"), db.cast(bucket, db.String).label("value"), db.func.count().label("gigs")]) \
+        .where(db.and_(Gig.payment >= PAYMENT_BUCKETS[0], *filters.conditions(skip=("payment",)))) \
+        .group_by(bucket).alias("payments")
+    rows = db.session.execute(db.union_all(db.select([locations]), db.select([payments]))).fetchall()
+
+    facets = {"location": [], "payment": []}
+    for facet, value, gigs in rows:
+        if facet == "location":
+            facets["location"].append((value, gigs))
+        else:
+            index = int(value)
+            facets["payment"].append((bucket_label(index), bucket_range(index), gigs))
+    facets["payment"].sort(key=lambda item: item[1][0])
+    return facets
+
+def cached_gig_facets(filters, timeout):
+    """Facet counts scan every matching gig, so they are shared between requests for `timeout` seconds."""
+    if not timeout:
+        return gig_facets(filters)
+    key   = repr(sorted(filters.args.items()))
+    entry = _facet_cache.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        entry = (time.monotonic() + timeout, gig_facets(filters))
+        _facet_cache.set(key, entry)
+    return entry[1]
+
+def filter_or_true(conditions):
+    return conditions or [db.true()]
@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms.fields import StringField, SubmitField, TextAreaField, DecimalField
-from wtforms.validators import InputRequired, DataRequired, Length
+from wtforms.fields.html5 import SearchField
+from wtforms.validators import InputRequired, DataRequired, Length, Optional, NumberRange
 from wtforms.widgets import Input
 from markupsafe import Markup
 
@@ -40,4 +41,22 @@ class CreateGigForm(GigForm):
     submit         = SubmitField("Create gig")
 
 class UpdateGigForm(GigForm):
-    submit         = SubmitField("Update gig")    
\ No newline at end of file
+    submit         = SubmitField("Update gig")
+
+class SearchForm(FlaskForm):
+    class Meta:
+        csrf = False # submitted with GET so results can be linked and paginated
+
+    q              = SearchField("Search gigs", validators=[ Length(max=100, message="Search must be at most 100 characters long")])
+    submit         = SubmitField("Search")
+
+class GigFilterForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    min_payment    = DecimalField("Min payment", validators=[ Optional(), NumberRange(min=0, message="Payment can not be negative")])
+    max_payment    = DecimalField("Max payment", validators=[ Optional(), NumberRange(min=0, message="Payment can not be negative")])
+    payment_under  = DecimalField("Payment under", validators=[ Optional(), NumberRange(min=0, message="Payment can not be negative")]) # exclusive, set by the payment facet links
+    location       = StringField("Location", validators=[ Optional(), Length(max=40, message="Location must be at most 40 characters long")])
+    employer       = StringField("Employer", validators=[ Optional(), Length(max=64, message="Employer must be at most 64 characters long")])
+    submit         = SubmitField("Filter")
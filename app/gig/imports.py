@@ -0,0 +1,182 @@
+import codecs
+import csv
+import json
+import math
+import time
+from functools import lru_cache
+from secrets import token_urlsafe
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from markupsafe import escape
+from slugify import slugify
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from app import db
+from app.models import User, Gig, Role, summarize_inserted_gigs
+from app.gig.forms import GigForm
+
+# Bulk gig import. Rows are parsed one at a time from the uploaded stream, checked by the same validators
+# as the create gig form and inserted in chunks, one executemany and one transaction per chunk, so memory
+# stays flat whatever the size of the file and a bad row only costs its own line in the report.
+
+FORMATS    = ("csv", "jsonl")
+FIELDS     = ("title", "description", "payment", "location")
+SLUG_TRIES = 5 # attempts at slugs unused by other gigs before the chunk gives up
+
+class ImportAborted(Exception):
+    """The import can't go on, as opposed to a rejected row: the file can't be read, or slugs ran out."""
+
+def guess_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+def _csv_rows(stream):
+    reader = csv.DictReader(codecs.iterdecode(stream, "utf-8-sig"))
+    try:
+        missing = [name for name in FIELDS if name not in (reader.fieldnames or ())]
+        if missing:
+            raise ImportAborted("Missing columns: " + ", ".join(missing))
+        for row in reader:
+            yield reader.line_num, row, None
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ImportAborted("Line %d: %s" % (reader.line_num + 1, e))
+
+def _jsonl_rows(stream):
+    for line_num, line in enumerate(stream, 1):
+        try:
+            line = line.decode("utf-8-sig" if line_num == 1 else "utf-8").strip()
+        except UnicodeDecodeError as e:
+            raise ImportAborted("Line %d: %s" % (line_num, e))
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, None, {"row": ["Invalid JSON: %s" % e]}
+            continue
+        if not isinstance(row, dict):
+            yield line_num, None, {"row": ["Expected a JSON object"]}
+            continue
+        errors = {name: ["Must be a string or a number"] for name in FIELDS
+                  if isinstance(row.get(name), (dict, list, bool))}
+        yield line_num, {name: str(value) for name, value in row.items() if value is not None}, errors or None
+
+@lru_cache(maxsize=4096)
+def _slug_base(title):
+    return slugify(title)
+
+def _slug(title):
+    return _slug_base(title) + "-" + token_urlsafe(3) # as Gig's title listener does
+
+class GigImporter():
+    """Validates and inserts the rows of one file for one employer. The form is processed again for
+    every row instead of being built per row, which takes most of the time of validating."""
+
+    def __init__(self, employer_id, batch_size):
+        self.employer_id = employer_id
+        self.batch_size  = batch_size
+        self.form        = GigForm(formdata=None, meta={"csrf": False})
+        self.imported    = 0
+        self.rejected    = 0
+
+    def validate(self, row):
+        """The gig's column values, or the form errors of the row."""
+        form = self.form
+        # every field is sent, empty when missing, as the create form does: an absent payment would pass
+        # the form but leave a gig the card templates can't render
+        form.process(MultiDict({name: row.get(name) or "" for name in FIELDS}))
+        if not form.validate():
+            return None, form.errors
+        payment = float(form.payment.data)
+        if not math.isfinite(payment):
+            return None, {"payment": ["Not a valid decimal value"]} # would poison the analytics sums
+        title = escape(form.title.data)
+        return {
+            "title": title,
+            "description": escape(form.description.data),
+            "payment": payment,
+            "location": escape(form.location.data),
+            "employer_id": self.employer_id,
+            "slug": _slug(title),
+        }, None
+
+    def insert(self, gigs):
+        """Inserts a chunk in one transaction. The random suffixes rarely collide, so slugs are only
+        looked up, and the taken ones replaced, after the unique index turned the chunk down."""
+        for _ in range(SLUG_TRIES):
+            try:
+                db.session.execute(Gig.__table__.insert(), gigs)
+                summarize_inserted_gigs(db.session, self.employer_id, gigs)
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                self.replace_taken_slugs(gigs)
+                continue
+            self.imported += len(gigs)
+            return
+        raise ImportAborted("Could not find unused slugs for the gigs")
+
+    def replace_taken_slugs(self, gigs):
+        seen  = set()
+        taken = {slug for slug, in db.session.query(Gig.slug).filter(Gig.slug.in_([gig["slug"] for gig in gigs]))}
+        for gig in gigs:
+            while gig["slug"] in taken or gig["slug"] in seen:
+                gig["slug"] = _slug(gig["title"])
+            seen.add(gig["slug"])
+
+    def run(self, rows):
+        """Yields a report per rejected row, {"line": ..., "errors": {...}}, and once every chunk is in,
+        {"imported": ..., "rejected": ...}. A file that can't be read ends the import early, keeping
+        the chunks committed so far, with an "error" in the summary."""
+        gigs, error = [], None
+        try:
+            for line_num, row, errors in rows:
+                if errors is None:
+                    gig, errors = self.validate(row)
+                if errors:
+                    self.rejected += 1
+                    yield {"line": line_num, "errors": errors}
+                    continue
+                gigs.append(gig)
+                if len(gigs) == self.batch_size:
+                    self.insert(gigs)
+                    gigs = []
+            if gigs:
+                self.insert(gigs)
+        except ImportAborted as e:
+            error = str(e)
+        summary = {"imported": self.imported, "rejected": self.rejected}
+        if error is not None:
+            summary["error"] = error
+        yield summary
+
+def import_gigs(stream, employer_id, format="csv", batch_size=None):
+    """Imports gigs for an employer from a binary stream of CSV with a header row, or of JSON objects one
+    per line, with the title, description, payment and location of each gig. Yields the reports of
+    GigImporter.run."""
+    if format not in FORMATS:
+        raise ValueError("Unknown format " + repr(format))
+    rows = _csv_rows(stream) if format == "csv" else _jsonl_rows(stream)
+    return GigImporter(employer_id, batch_size or current_app.config["IMPORT_BATCH_SIZE"]).run(rows)
+
+@click.command("import-gigs")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--employer", "email", required=True, help="Email of the employer the gigs are created for.")
+@click.option("--format", type=click.Choice(FORMATS), help="Defaults to jsonl for .jsonl/.ndjson files, csv otherwise.")
+@click.option("--batch-size", type=int, help="Rows per transaction, defaults to IMPORT_BATCH_SIZE.")
+@with_appcontext
+def import_gigs_command(path, email, format, batch_size):
+    """Import gigs from a CSV or JSON lines file."""
+    employer = User.query.filter_by(email=email).first()
+    if employer is None or not employer.is_role(Role.EMPLOYER):
+        raise click.BadParameter("no employer with that email", param_hint="--employer")
+    started = time.perf_counter()
+    with open(path, "rb") as stream:
+        for report in import_gigs(stream, employer.id, format or guess_format(path), batch_size):
+            if "line" in report:
+                for field, messages in report["errors"].items():
+                    print("Line %d: %s: %s" % (report["line"], field, " ".join(messages)))
+    elapsed = time.perf_counter() - started
+    print("Imported %d gigs, rejected %d, in %.2fs" % (report["imported"], report["rejected"], elapsed))
+    if "error" in report:
+        raise click.ClickException(report["error"])
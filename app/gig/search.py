@@ -0,0 +1,56 @@
+import re
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import Gig, GIG_SEARCH_DDL
+
+# bm25 column weights for title, description and location
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+
+class SearchPage():
+    def __init__(self, items, page, has_next):
+        self.items    = items
+        self.page     = page
+        self.has_prev = page > 1
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def match_expression(terms):
+    """Turns user input into an FTS5 query: every word must match, as a prefix, so FTS syntax can't leak in."""
+    words = re.findall(r"\w+", terms or "")
+    return " ".join('"%s"*' % word for word in words)
+
+def search_gigs(terms, page=1, per_page=24):
+    expression = match_expression(terms)
+    if not expression:
+        return SearchPage([], page, False)
+
+    rows = db.session.execute(
+        db.text("SELECT rowid FROM gigs_fts WHERE gigs_fts MATCH :expression "
+                "ORDER BY bm25(gigs_fts, %s) LIMIT :limit OFFSET :offset" % ", ".join(map(str, SEARCH_WEIGHTS))),
+        {"expression": expression, "limit": per_page + 1, "offset": (page - 1) * per_page}
+    ).fetchall()
+    ids = [gig_id for gig_id, in rows[:per_page]]
+
+    gigs = {gig.id: gig for gig in Gig.query.options(db.joinedload(Gig.employer)).filter(Gig.id.in_(ids))}
+    return SearchPage([gigs[gig_id] for gig_id in ids if gig_id in gigs], page, len(rows) > per_page)
+
+def create_search_index(rebuild=False):
+    for statement in GIG_SEARCH_DDL:
+        db.session.execute(db.text(statement))
+    if rebuild:
+        db.session.execute(db.text("INSERT INTO gigs_fts(gigs_fts) VALUES('rebuild')"))
+    db.session.commit()
+
+@click.command("search-index")
+@click.option("--rebuild", is_flag=True, help="Re-index every gig, needed once for databases created before the index existed.")
+@with_appcontext
+def search_index_command(rebuild):
+    """Create the full-text gig search index and its triggers."""
+    create_search_index(rebuild)
+    print("Search index is ready!")
@@ -1,9 +1,13 @@
-from flask import Blueprint, render_template, request, flash, abort, url_for, redirect
+from flask import Blueprint, render_template, request, flash, abort, url_for, redirect, current_app
 from app.auth.views import current_user, activation_required, login_required, role_required
 from app import db
 from app.models import User, Role, Gig
 from werkzeug.utils import escape, unescape
-from app.gig.forms import CreateGigForm, UpdateGigForm
+from app.gig.forms import CreateGigForm, UpdateGigForm, SearchForm
+from app.gig.search import search_gigs
+from app.analytics import employer_dashboard
+from app.loaders import load
+from app.database import read_only
 from functools import wraps
 
 gig = Blueprint("gig", __name__, template_folder="templates") 
@@ -11,7 +15,7 @@ gig = Blueprint("gig", __name__, template_folder="templates")
 def gig_owner_required(f):
     @wraps(f)
     def _gig_owner_required(*args, **kwargs):
-        gig = Gig.query.filter_by(slug=request.view_args["slug"]).first()
+        gig = load(Gig, slug=request.view_args["slug"])
         if not gig or not current_user.is_gig_owner(gig):
             flash("You are not the owner of that gig.", "danger")
             return redirect(url_for("main.home"))
@@ -47,7 +51,7 @@ def create():
 def edit(slug):
     form = UpdateGigForm()
 
-    gig = Gig.query.filter_by(slug=slug).first()
+    gig = load(Gig, slug=slug)
 
     if form.validate_on_submit():
         gig.title        = escape(form.title.data)
@@ -72,39 +76,61 @@ def edit(slug):
 @gig_owner_required
 @activation_required
 def delete(slug):
-    gig = Gig.query.filter_by(slug=slug).first()
+    gig = load(Gig, slug=slug)
     db.session.delete(gig)
     db.session.commit()
     flash("The gig was deleted", "success")
     return redirect(url_for("main.home")) 
 
 @gig.route("/info/<slug>")
+@read_only
 @login_required
 def show(slug):
-    gig = Gig.query.filter_by(slug=slug).first()
+    gig = load(Gig, slug=slug)
     if not gig:
         abort(404)
     musicians = gig.musicians.all()
     return render_template("show_gig.html", gig=gig, musicians=musicians)
 
+@gig.route("/search")
+@read_only
+@login_required
+@activation_required
+def search():
+    form = SearchForm(request.args)
+    gigs = None
+    if form.q.data and form.validate():
+        page = max(request.args.get("page", 1, type=int), 1)
+        gigs = search_gigs(form.q.data, page, current_app.config["FEED_PER_PAGE"])
+    return render_template("search.html", form=form, gigs=gigs)
+
 @gig.route("/my_gigs")
 @login_required
 @activation_required
 def my_gigs():
     gigs = None
     if current_user.is_role(Role.MUSICIAN):
-        gigs = current_user.applied_gigs.all()
+        gigs = current_user.applied_gigs.options(db.joinedload(Gig.employer)).all()
     if current_user.is_role(Role.EMPLOYER):
-        gigs = current_user.gigs.all()
+        gigs = current_user.gigs.options(db.joinedload(Gig.employer)).all()
         
     return render_template("my_gigs.html", gigs=gigs)
 
+@gig.route("/dashboard")
+@read_only
+@login_required
+@role_required(Role.EMPLOYER)
+@activation_required
+def dashboard():
+    stats = employer_dashboard(current_user, current_app.config["ANALYTICS_DAYS"])
+    return render_template("dashboard.html", **stats)
+
 @gig.route("/apply/<slug>", methods=["POST"])
 @login_required
 @role_required(Role.MUSICIAN)
 @activation_required
 def apply_to_gig(slug):
-    gig = Gig.query.filter_by(slug=slug).first()
+    gig = load(Gig, slug=slug)
     if not gig:
         abort(404)
         
@@ -0,0 +1,24 @@
+from flask import current_app
+
+class LazyMail():
+    """Flask-Mail, imported and configured for the current app the first time a mail goes out."""
+
+    def __init__(self):
+        self._mail = None
+
+    def init_app(self, app):
+        app.extensions.pop("mail", None) # read from app.config on first use, so later config changes apply
+
+    def _get_mail(self):
+        if self._mail is None:
+            from flask_mail import Mail
+            self._mail = Mail()
+        if "mail" not in current_app.extensions:
+            self._mail.init_app(current_app)
+        return self._mail
+
+    def send(self, message):
+        return self._get_mail().send(message)
+
+    def connect(self):
+        return self._get_mail().connect()
@@ -0,0 +1,48 @@
+from flask import g, has_app_context
+from app import db
+
+# Request-scoped identity cache: decorators, form validators and views all load rows through here,
+# so each entity is fetched at most once per request. Rows are remembered under every unique
+# column, so loading a user by email also answers a later lookup by id or username.
+
+def _cache():
+    if not has_app_context():
+        return None
+    cache = getattr(g, "_entity_cache", None)
+    if cache is None:
+        cache = g._entity_cache = {}
+    return cache
+
+def _unique_columns(model):
+    return [column.key for column in model.__table__.columns if column.primary_key or column.unique]
+
+def _remember(cache, model, entity):
+    for key in _unique_columns(model):
+        cache[(model, key, getattr(entity, key))] = entity
+
+def load(model, **criteria):
+    """Returns the first `model` row matching the single unique `criteria`, or None."""
+    (key, value), = criteria.items()
+    cache = _cache()
+    if cache is None:
+        return model.query.filter_by(**criteria).first()
+    if (model, key, value) not in cache:
+        entity = model.query.filter_by(**criteria).first()
+        cache[(model, key, value)] = entity
+        if entity is not None:
+            _remember(cache, model, entity)
+    return cache[(model, key, value)]
+
+def prefetch(model, **criteria):
+    """Loads the rows matching any of the unique `criteria` in a single query."""
+    cache = _cache()
+    if cache is None:
+        return
+    missing = {key: value for key, value in criteria.items() if (model, key, value) not in cache}
+    if not missing:
+        return
+    conditions = [getattr(model, key) == value for key, value in missing.items()]
+    for entity in model.query.filter(db.or_(*conditions)):
+        _remember(cache, model, entity)
+    for key, value in missing.items():
+        cache.setdefault((model, key, value), None)
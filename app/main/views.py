@@ -1,14 +1,28 @@
-from flask import Blueprint, render_template, session
+from flask import Blueprint, render_template, session, request, current_app
 from app.auth.views import current_user
+from app import db
 from app.models import User, Role, Gig
+from app.pagination import keyset_paginate
+from app.gig.forms import GigFilterForm
+from app.gig.filters import GigFilters, cached_gig_facets
+from app.database import read_only
+from app.recommend import recommender
 
 main = Blueprint('main', __name__, template_folder='templates')
 
 @main.route('/')
+@read_only
 def home():
-	musicians = gigs = None
+	musicians = gigs = filter_form = filters = facets = recommended = None
 	if current_user.is_role(Role.MUSICIAN):
-		gigs = Gig.query.all()	
+		filter_form = GigFilterForm(request.args)
+		filters = GigFilters(filter_form)
+		gigs = keyset_paginate(filters.apply(Gig.query.options(db.joinedload(Gig.employer))), Gig.id)
+		facets = cached_gig_facets(filters, current_app.config["FACET_CACHE_SECONDS"])
+		first_page = not filters.active and "after" not in request.args and "before" not in request.args
+		if first_page and current_app.config["RECOMMEND_FEED_SIZE"]:
+			recommended = recommender.recommend(current_user, current_app.config["RECOMMEND_FEED_SIZE"])
 	if current_user.is_role(Role.EMPLOYER):
-		musicians = User.query.filter_by(role_id=Role.MUSICIAN).all()	
-	return render_template('home.html', gigs=gigs, musicians=musicians)
+		musicians = keyset_paginate(User.query.filter_by(role_id=Role.MUSICIAN), User.id)
+	return render_template('home.html', gigs=gigs, musicians=musicians, filter_form=filter_form, filters=filters, facets=facets, recommended=recommended)
+
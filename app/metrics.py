@@ -0,0 +1,167 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from flask import g, request, current_app, has_request_context, Response, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Registry():
+    """Process-local counters, gauges and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock       = Lock()
+        self._types      = {}
+        self._help       = {}
+        self._values     = defaultdict(float)
+        self._histograms = {}
+        self._collectors = []
+
+    def _declare(self, name, metric_type, help_text):
+        self._types.setdefault(name, metric_type)
+        if help_text:
+            self._help.setdefault(name, help_text)
+
+    def inc(self, name, value=1, help_text=None, **labels):
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            self._values[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name, value, help_text=None, **labels):
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help_text=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+            histogram[1][bisect_left(buckets, value)] += 1
+            histogram[2] += value
+
+    def register_collector(self, collector):
+        """`collector` is called on every scrape and returns (name, type, help, labels, value) tuples."""
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+            self._histograms.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            values     = dict(self._values)
+            histograms = {key: (buckets, list(counts), total) for key, (buckets, counts, total) in self._histograms.items()}
+            types      = dict(self._types)
+            help_texts = dict(self._help)
+        for collector in self._collectors:
+            for name, metric_type, help_text, labels, value in collector():
+                types.setdefault(name, metric_type)
+                if help_text:
+                    help_texts.setdefault(name, help_text)
+                values[(name, tuple(sorted(labels.items())))] = value
+
+        samples = defaultdict(list)
+        for (name, labels), value in sorted(values.items()):
+            samples[name].append(_sample(name, labels, value))
+        for (name, labels), (buckets, counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), counts):
+                cumulative += count
+                samples[name].append(_sample(name + "_bucket", labels + (("le", str(bound)),), cumulative))
+            samples[name].append(_sample(name + "_sum", labels, total))
+            samples[name].append(_sample(name + "_count", labels, cumulative))
+
+        for name in sorted(samples):
+            if name in help_texts:
+                lines.append("# HELP %s %s" % (name, help_texts[name]))
+            lines.append("# TYPE %s %s" % (name, types[name]))
+            lines.extend(samples[name])
+        return "\n".join(lines) + "\n"
+
+def _sample(name, labels, value):
+    if labels:
+        label_text = ",".join('%s="%s"' % (key, str(label).replace("\\", "\\\\").replace('"', '\\"')) for key, label in labels)
+        return "%s{%s} %s" % (name, label_text, repr(float(value)))
+    return "%s %s" % (name, repr(float(value)))
+
+registry = Registry()
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    return getattr(g, "_request_stats", None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started_at = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    if stats is not None:
+        stats["sql_queries"] += 1
+        stats["sql_seconds"] += time.perf_counter() - context._metrics_started_at
+
+def _before_render_template(app, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats["render_started_at"].append(time.perf_counter())
+
+def _template_rendered(app, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats["render_started_at"]:
+        stats["render_seconds"] += time.perf_counter() - stats["render_started_at"].pop()
+
+def _start_request():
+    g._request_stats = {
+        "started_at": time.perf_counter(),
+        "sql_queries": 0,
+        "sql_seconds": 0.0,
+        "render_started_at": [],
+        "render_seconds": 0.0
+    }
+
+def _finish_request(response):
+    stats = _request_stats()
+    if stats is None:
+        return response
+    total    = time.perf_counter() - stats["started_at"]
+    endpoint = request.endpoint or "unknown"
+
+    registry.observe("http_request_duration_seconds", total, endpoint=endpoint,
+                     help_text="Total time spent handling the request")
+    registry.inc("http_requests_total", endpoint=endpoint, status=str(response.status_code),
+                 help_text="Handled requests")
+    registry.inc("sql_queries_total", stats["sql_queries"], endpoint=endpoint,
+                 help_text="SQL statements executed while handling requests")
+    registry.inc("sql_duration_seconds_total", stats["sql_seconds"], endpoint=endpoint,
+                 help_text="Time spent executing SQL statements")
+    registry.inc("template_render_seconds_total", stats["render_seconds"], endpoint=endpoint,
+                 help_text="Time spent rendering templates")
+
+    if current_app.config["METRICS_SERVER_TIMING"]:
+        response.headers.add("Server-Timing", 'sql;desc="%d queries";dur=%.2f, render;dur=%.2f, total;dur=%.2f' % (
+            stats["sql_queries"], stats["sql_seconds"] * 1000, stats["render_seconds"] * 1000, total * 1000))
+    return response
+
+def metrics_view():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+def init_metrics(app):
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
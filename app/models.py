@@ -1,7 +1,12 @@
 from app import db
+from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from secrets import  token_urlsafe
+import hashlib
+import hmac
+import json
 from sqlalchemy import event
+from sqlalchemy.orm.attributes import set_committed_value
 from slugify import slugify
 from datetime import datetime
 
@@ -14,11 +19,31 @@ def generate_hash(token):
 def _check_token(hash, token):
     return check_password_hash(hash, token)
 
+def generate_digest(token):
+    # tokens are random and long enough that a keyed sha256 is as safe as PBKDF2 here, and much cheaper
+    key = current_app.config["SECRET_KEY"].encode()
+    return hmac.new(key, token.encode(), hashlib.sha256).hexdigest()
+
+def _check_digest(digest, token):
+    return hmac.compare_digest(digest, generate_digest(token))
+
 applications = db.Table("applications",
-    db.Column("gig_id", db.Integer(), db.ForeignKey("gigs.id")),
-    db.Column("musician_id", db.Integer(), db.ForeignKey("users.id")) 
+    db.Column("gig_id", db.Integer(), db.ForeignKey("gigs.id"), primary_key=True),
+    db.Column("musician_id", db.Integer(), db.ForeignKey("users.id"), primary_key=True),
+    db.Column("applied_at", db.DateTime()), # NULL for applications made before it was recorded
+    db.Index("ix_applications_musician_id_gig_id", "musician_id", "gig_id") # a musician's applications, the primary key covers a gig's applicants
 )
 
+def insert_ignore(table):
+    """INSERT that silently skips rows conflicting with an existing key."""
+    dialect = db.get_engine().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == "mysql":
+        return table.insert().prefix_with("IGNORE")
+    return table.insert().prefix_with("OR IGNORE")
+
 class Role():
     ADMIN    = 1
     MUSICIAN = 2
@@ -27,13 +52,23 @@ class Role():
 class Gig(db.Model):
     __tablename__ = "gigs"
 
-    id          = db.Column(db.Integer(), primary_key=True)
-    title       = db.Column(db.String(255), nullable=False)
-    description = db.Column(db.Text())
-    payment     = db.Column(db.Float())
-    location    = db.Column(db.String(255))
-    employer_id = db.Column(db.Integer(), db.ForeignKey("users.id"), index=True, nullable=False)
-    slug        = db.Column(db.String(255), nullable=False, unique=True)
+    id              = db.Column(db.Integer(), primary_key=True)
+    title           = db.Column(db.String(255), nullable=False)
+    description     = db.Column(db.Text())
+    payment         = db.column_property(db.Column(db.Float()), active_history=True) # edits move the old value out of the analytics
+    location        = db.column_property(db.Column(db.String(255)), active_history=True)
+    employer_id     = db.Column(db.Integer(), db.ForeignKey("users.id"), index=True, nullable=False)
+    slug            = db.Column(db.String(255), nullable=False, unique=True)
+    version         = db.Column(db.Integer(), nullable=False, default=1, server_default="1")
+    applicant_count = db.Column(db.Integer(), nullable=False, default=0, server_default="0")
+    updated_at      = db.Column(db.DateTime(), default=datetime.utcnow) # set on create and edit, not by counter updates
+
+    __mapper_args__ = {"version_id_col": version} # bumped on every update, used by caches to key rendered gigs
+    __table_args__  = (
+        db.Index("ix_gigs_location_payment", "location", "payment"),
+        db.Index("ix_gigs_payment", "payment"),
+        db.Index("ix_gigs_updated_at", "updated_at"), # lets the recommendation index pick up edits from every process
+    )
 
     def __init__(self, title, description, payment, location, employer_id):
         self.title         = title
@@ -46,21 +81,52 @@ class Gig(db.Model):
 def update_slug(target, value, old_value, initiator):
     target.slug = slugify(value) + "-" + token_urlsafe(3) 
 
+@event.listens_for(Gig, "before_update")
+def touch_gig(mapper, connection, target):
+    if db.session.is_modified(target, include_collections=False): # dirty collections alone don't update the row
+        target.updated_at = datetime.utcnow()
+
+# Full-text index over gigs. An external content FTS5 table stores only the index, triggers keep it in
+# sync with every insert/update/delete, including bulk inserts that bypass the ORM.
+GIG_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS gigs_fts USING fts5(
+        title, description, location, content='gigs', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS gigs_fts_insert AFTER INSERT ON gigs BEGIN
+        INSERT INTO gigs_fts(rowid, title, description, location) VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS gigs_fts_delete AFTER DELETE ON gigs BEGIN
+        INSERT INTO gigs_fts(gigs_fts, rowid, title, description, location) VALUES ('delete', old.id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS gigs_fts_update AFTER UPDATE OF title, description, location ON gigs BEGIN
+        INSERT INTO gigs_fts(gigs_fts, rowid, title, description, location) VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO gigs_fts(rowid, title, description, location) VALUES (new.id, new.title, new.description, new.location);
+    END"""
+]
+
+for statement in GIG_SEARCH_DDL:
+    event.listen(Gig.__table__, "after_create", db.DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Gig.__table__, "before_drop", db.DDL("DROP TABLE IF EXISTS gigs_fts").execute_if(dialect="sqlite"))
+
 class Remember(db.Model):
     __tablename__ = "remembers"
     
     id            = db.Column(db.Integer(), primary_key=True)
+    selector      = db.Column(db.String(32), unique=True, index=True) # NULL for legacy rows hashed with PBKDF2
     remember_hash = db.Column(db.String(255), nullable=False)
-    used_id       =  db.Column(db.Integer(), db.ForeignKey("users.id"), index=True)
+    user_id       = db.Column("used_id", db.Integer(), db.ForeignKey("users.id"), index=True)
     
     
     def __init__(self, user_id):
-        self.token         = generate_token()
-        self.remember_hash = generate_hash(self.token)
+        self.selector      = generate_token()[:16]
+        validator          = generate_token()
+        self.token         = self.selector + ":" + validator # selector finds the row, validator proves ownership
+        self.remember_hash = generate_digest(validator)
         self.user_id       = user_id
         
     def check_token(self, token):
-        return _check_token(self.remember_hash, token)
+        if self.selector is None:
+            return _check_token(self.remember_hash, token)
+        return _check_digest(self.remember_hash, token)
 
 class User(db.Model):
     __tablename__ = "users"
@@ -80,6 +146,11 @@ class User(db.Model):
     activation_sent_at = db.Column(db.DateTime())
     reset_hash         = db.Column(db.String(255))
     reset_sent_at      = db.Column(db.DateTime()) 
+    gig_count          = db.Column(db.Integer(), nullable=False, default=0, server_default="0")
+    application_count  = db.Column(db.Integer(), nullable=False, default=0, server_default="0")
+    version            = db.Column(db.Integer(), nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version} # bumped on every profile change, used by API ETags
      
     
     def __init__(self, username="", email="", password="", location="", description="", role_id=Role.ADMIN):
@@ -120,10 +191,16 @@ class User(db.Model):
         return remember_instance.token
     
     def check_remember_token(self, token):
-        if token:
-            for remember_hash in self.remember_hashes:
-                if remember_hash.check_token(token):
-                    return True
+        if not token or not isinstance(token, str):
+            return False
+        selector, separator, validator = token.partition(":")
+        if separator:
+            remember = self.remember_hashes.filter_by(selector=selector).first()
+            return remember is not None and remember.check_token(validator)
+        # cookies issued before selectors existed still work until they expire
+        for remember_hash in self.remember_hashes.filter_by(selector=None):
+            if remember_hash.check_token(token):
+                return True
         return False
     
     def forget(self):
@@ -138,20 +215,36 @@ class User(db.Model):
     def is_gig_owner(self, gig):
         return self.id == gig.employer_id
     
+    def applied_gig_ids(self):
+        # loaded once per instance so a list of gig cards costs a single query
+        _applied_gig_ids = getattr(self, "_applied_gig_ids", None)
+        if _applied_gig_ids is None:
+            rows = db.session.query(applications.c.gig_id).filter(applications.c.musician_id == self.id)
+            _applied_gig_ids = self._applied_gig_ids = {gig_id for gig_id, in rows}
+        return _applied_gig_ids
+    
     def is_applied_to(self, gig):
-        if gig is None:
+        if gig is None or self.id is None:
             return False
-        return self.applied_gigs.filter_by(id=gig.id).first() is not None
+        return gig.id in self.applied_gig_ids()
     
     def apply(self, gig):
-        if not self.is_applied_to(gig):
-            self.applied_gigs.append(gig)
-            db.session.add(self)
+        # one idempotent statement, a double submit can't insert the application twice
+        applied_at = datetime.utcnow()
+        result = db.session.execute(insert_ignore(applications).values(gig_id=gig.id, musician_id=self.id, applied_at=applied_at))
+        if result.rowcount:
+            _adjust_application_counts(self, gig, 1, applied_at)
+        if getattr(self, "_applied_gig_ids", None) is not None:
+            self._applied_gig_ids.add(gig.id)
             
     def remove_application(self, gig):
-        if self.is_applied_to(gig):
-            self.applied_gigs.remove(gig)
-            db.session.add(self)
+        condition  = db.and_(applications.c.gig_id == gig.id, applications.c.musician_id == self.id)
+        applied_at = db.session.execute(db.select([applications.c.applied_at]).where(condition)).scalar()
+        result     = db.session.execute(applications.delete().where(condition))
+        if result.rowcount:
+            _adjust_application_counts(self, gig, -1, applied_at)
+        if getattr(self, "_applied_gig_ids", None) is not None:
+            self._applied_gig_ids.discard(gig.id)
             
     def is_active(self):
         return self.activated
@@ -175,4 +268,181 @@ class User(db.Model):
         minutes_from_sending_reset = (datetime.utcnow() - self.reset_sent_at).total_seconds()/60
         if _check_token(self.reset_hash, token) and minutes_from_sending_reset < 30:
             return True
-        return False
\ No newline at end of file
+        return False
+
+# Denormalized counters. They are changed with relative UPDATEs so concurrent requests can't lose
+# increments, and bypass the ORM so bumping a gig's applicant count doesn't bump its version.
+# `flask reconcile-counters` repairs any drift, e.g. after raw SQL or bulk inserts.
+
+def _increment(connection, column, delta, condition):
+    connection.execute(column.table.update().where(condition).values({column.name: column + delta}))
+
+def _adjust_application_counts(musician, gig, delta, applied_at):
+    _increment(db.session, Gig.__table__.c.applicant_count, delta, Gig.__table__.c.id == gig.id)
+    _increment(db.session, User.__table__.c.application_count, delta, User.__table__.c.id == musician.id)
+    _adjust_loaded(gig, "applicant_count", delta)
+    _adjust_loaded(musician, "application_count", delta)
+    _summarize_applicants(db.session, gig, applied_at, delta)
+
+def _adjust_loaded(target, key, delta):
+    # keeps an already loaded instance in step without marking it dirty or loading the column
+    if key in target.__dict__:
+        set_committed_value(target, key, target.__dict__[key] + delta)
+
+@event.listens_for(Gig, "after_insert")
+def count_created_gig(mapper, connection, target):
+    _increment(connection, User.__table__.c.gig_count, 1, User.__table__.c.id == target.employer_id)
+
+@event.listens_for(Gig, "after_delete")
+def count_deleted_gig(mapper, connection, target):
+    _increment(connection, User.__table__.c.gig_count, -1, User.__table__.c.id == target.employer_id)
+
+@event.listens_for(db.session, "before_flush")
+def count_deleted_applications(session, flush_context, instances):
+    # the flush deletes application rows before the gigs and users they belong to, so count them first
+    for target in session.deleted:
+        if isinstance(target, Gig):
+            applicants = db.select([applications.c.musician_id]).where(applications.c.gig_id == target.id)
+            _increment(session, User.__table__.c.application_count, -1, User.__table__.c.id.in_(applicants))
+        elif isinstance(target, User):
+            applied = db.select([applications.c.gig_id]).where(applications.c.musician_id == target.id)
+            _increment(session, Gig.__table__.c.applicant_count, -1, Gig.__table__.c.id.in_(applied))
+
+# Employer analytics. Pre-aggregated rows the employer dashboard reads instead of scanning gigs and
+# applications, kept in step by the same relative UPDATEs as the counters above. `flask rebuild-analytics`
+# recomputes them from scratch.
+
+gig_daily_applicants = db.Table("gig_daily_applicants",
+    db.Column("gig_id", db.Integer(), db.ForeignKey("gigs.id"), primary_key=True),
+    db.Column("day", db.Date(), primary_key=True),
+    db.Column("employer_id", db.Integer(), nullable=False),
+    db.Column("applicants", db.Integer(), nullable=False, default=0),
+    db.Index("ix_gig_daily_applicants_employer_id_day", "employer_id", "day") # an employer's recent days in one range scan
+)
+
+location_payments = db.Table("location_payments",
+    db.Column("location", db.String(255), primary_key=True),
+    db.Column("gig_count", db.Integer(), nullable=False, default=0), # gigs with a payment
+    db.Column("payment_total", db.Float(), nullable=False, default=0)
+)
+
+employer_stats = db.Table("employer_stats",
+    db.Column("employer_id", db.Integer(), db.ForeignKey("users.id"), primary_key=True),
+    db.Column("payment_total", db.Float(), nullable=False, default=0),
+    db.Column("applicant_count", db.Integer(), nullable=False, default=0)
+)
+
+SUMMARY_TABLES = (gig_daily_applicants, location_payments, employer_stats)
+
+def _shift(connection, table, key, deltas, create, columns=None, prune=None):
+    """Adds the deltas to the summary row at key. Only additions (`create`) make a missing row, with
+    `columns` too, so the decrements that follow a deleted gig or employer don't bring its row back, and
+    a decrement deletes the row once its `prune` column is down to zero, as a rebuild would."""
+    condition = db.and_(*[table.c[name] == value for name, value in key.items()])
+    if create:
+        connection.execute(insert_ignore(table).values(dict(key, **(columns or {}), **{name: 0 for name in deltas})))
+    connection.execute(table.update().where(condition).values({name: table.c[name] + delta for name, delta in deltas.items()}))
+    if prune is not None and not create:
+        connection.execute(table.delete().where(db.and_(condition, table.c[prune] <= 0)))
+
+def _summarize_applicants(connection, gig, applied_at, delta):
+    if applied_at is not None:
+        _shift(connection, gig_daily_applicants, {"gig_id": gig.id, "day": applied_at.date()}, {"applicants": delta},
+               delta > 0, {"employer_id": gig.employer_id}, prune="applicants")
+    _shift(connection, employer_stats, {"employer_id": gig.employer_id}, {"applicant_count": delta}, delta > 0)
+
+def _summarize_payment(connection, employer_id, location, payment, sign):
+    if payment is None:
+        return
+    # payments can be negative, so whether a row may be created goes by the sign of the gig count
+    _shift(connection, employer_stats, {"employer_id": employer_id}, {"payment_total": sign * payment}, sign > 0)
+    if location is not None:
+        _shift(connection, location_payments, {"location": location}, {"gig_count": sign, "payment_total": sign * payment},
+               sign > 0, prune="gig_count")
+
+def summarize_inserted_gigs(connection, employer_id, gigs):
+    """Counters and summary rows for gigs inserted by Core statements, which skip the ORM events above.
+    One statement per distinct location rather than per gig."""
+    _increment(connection, User.__table__.c.gig_count, len(gigs), User.__table__.c.id == employer_id)
+    locations = {}
+    for gig in gigs:
+        if gig["payment"] is not None and gig["location"] is not None:
+            count, total = locations.get(gig["location"], (0, 0))
+            locations[gig["location"]] = (count + 1, total + gig["payment"])
+    payments = [gig["payment"] for gig in gigs if gig["payment"] is not None]
+    if payments:
+        _shift(connection, employer_stats, {"employer_id": employer_id}, {"payment_total": sum(payments)}, True)
+    for location, (count, total) in locations.items():
+        _shift(connection, location_payments, {"location": location}, {"gig_count": count, "payment_total": total}, True)
+
+@event.listens_for(Gig, "after_insert")
+def summarize_created_gig(mapper, connection, target):
+    _summarize_payment(connection, target.employer_id, target.location, target.payment, 1)
+
+@event.listens_for(Gig, "after_update")
+def summarize_updated_gig(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    payment, location = attrs.payment.history, attrs.location.history
+    if payment.has_changes() or location.has_changes():
+        old_payment  = payment.deleted[0] if payment.deleted else target.payment
+        old_location = location.deleted[0] if location.deleted else target.location
+        _summarize_payment(connection, target.employer_id, old_location, old_payment, -1)
+        _summarize_payment(connection, target.employer_id, target.location, target.payment, 1)
+
+@event.listens_for(Gig, "after_delete")
+def summarize_deleted_gig(mapper, connection, target):
+    _summarize_payment(connection, target.employer_id, target.location, target.payment, -1)
+
+@event.listens_for(db.session, "before_flush")
+def summarize_deleted_applications(session, flush_context, instances):
+    # like count_deleted_applications, runs while the application rows still exist
+    daily, stats, gigs = gig_daily_applicants, employer_stats, Gig.__table__
+    for target in session.deleted:
+        if isinstance(target, Gig):
+            applicants = db.select([db.func.count()]).where(applications.c.gig_id == target.id).as_scalar()
+            session.execute(stats.update().where(stats.c.employer_id == target.employer_id)
+                            .values(applicant_count=stats.c.applicant_count - applicants))
+            session.execute(daily.delete().where(daily.c.gig_id == target.id))
+        elif isinstance(target, User):
+            session.execute(daily.delete().where(daily.c.employer_id == target.id))
+            session.execute(stats.delete().where(stats.c.employer_id == target.id))
+            applied = applications.join(gigs, gigs.c.id == applications.c.gig_id)
+            same_day = db.exists().where(db.and_(applications.c.musician_id == target.id,
+                                                 applications.c.gig_id == daily.c.gig_id,
+                                                 db.func.date(applications.c.applied_at) == daily.c.day))
+            session.execute(daily.update().where(same_day).values(applicants=daily.c.applicants - 1))
+            session.execute(daily.delete().where(db.and_(same_day, daily.c.applicants <= 0)))
+            applicants = (db.select([db.func.count()]).select_from(applied)
+                          .where(db.and_(applications.c.musician_id == target.id, gigs.c.employer_id == stats.c.employer_id)).as_scalar())
+            employers  = db.select([gigs.c.employer_id]).select_from(applied).where(applications.c.musician_id == target.id)
+            session.execute(stats.update().where(stats.c.employer_id.in_(employers))
+                            .values(applicant_count=stats.c.applicant_count - applicants))
+
+class OutboxMail(db.Model):
+    __tablename__ = "outbox_mails"
+
+    id              = db.Column(db.Integer(), primary_key=True)
+    subject         = db.Column(db.String(255), nullable=False)
+    sender          = db.Column(db.String(255), nullable=False)
+    recipients      = db.Column(db.Text(), nullable=False) # JSON list
+    body            = db.Column(db.Text())
+    html            = db.Column(db.Text())
+    created_at      = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+    attempts        = db.Column(db.Integer(), nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+    sent_at         = db.Column(db.DateTime())
+    last_error      = db.Column(db.Text())
+
+    __table_args__  = (
+        db.Index("ix_outbox_mails_due", "sent_at", "next_attempt_at"),
+    )
+
+    def __init__(self, subject, sender, recipients, body, html):
+        self.subject    = subject
+        self.sender     = sender
+        self.recipients = json.dumps(list(recipients))
+        self.body       = body
+        self.html       = html
+
+    def recipient_list(self):
+        return json.loads(self.recipients)
@@ -0,0 +1,63 @@
+from flask import request, current_app
+
+
+class KeysetPage():
+    def __init__(self, items, has_prev, has_next, key):
+        self.items    = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.key      = key
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return getattr(self.items[0], self.key)
+        return None
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return getattr(self.items[-1], self.key)
+        return None
+
+
+def _cursor_arg(name, on_invalid):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        if on_invalid is not None:
+            on_invalid({name: ["Not a valid integer"]})
+        return None # a mangled cursor link falls back to the first page
+
+def keyset_paginate(query, column, per_page=None, on_invalid=None):
+    """Paginates `query` on the unique, indexed `column` using the `after`/`before`
+    request args as cursors, so every page costs the same regardless of table size.
+    A cursor that isn't an integer is ignored, or passed to `on_invalid` as
+    {arg: [message]} when given."""
+    per_page = per_page or current_app.config["FEED_PER_PAGE"]
+    after    = _cursor_arg("after", on_invalid)
+    before   = _cursor_arg("before", on_invalid)
+
+    if before is not None:
+        items    = query.filter(column < before).order_by(column.desc()).limit(per_page + 1).all()
+        has_prev = len(items) > per_page
+        items    = list(reversed(items[:per_page]))
+        has_next = True
+    else:
+        if after is not None:
+            query = query.filter(column > after)
+        items    = query.order_by(column.asc()).limit(per_page + 1).all()
+        has_next = len(items) > per_page
+        items    = items[:per_page]
+        has_prev = after is not None
+
+    return KeysetPage(items, has_prev, has_next, column.key)
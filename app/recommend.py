@@ -0,0 +1,307 @@
+import html
+import math
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db
+from app.models import Gig
+
+# Content based gig recommendations. Every gig is a TF-IDF vector over the words and word pairs of its
+# title, description and location, kept as an inverted index of numpy arrays: for every term, the rows
+# of the gigs containing it and their weights. A musician's description and location are scored against
+# all gigs with one vectorized accumulation per term. numpy is imported on first use only.
+
+TOKEN            = re.compile(r"[a-z0-9]+")
+STOP_WORDS       = frozenset("""a about all am an and any are as at be but by can do for from have here hi hello
+                                i if in is it just me my need needed of on or our please so some that the there
+                                this to us we will with you your""".split())
+TITLE_WEIGHT     = 2      # title terms count as this many occurrences
+MAX_DF           = 0.5    # terms in more than this share of gigs don't tell gigs apart, queries skip them
+SYNC_OVERLAP     = 60     # seconds re-read before the last sync, for edits committed late
+COMPACT_FRACTION = 0.1    # appended postings are merged into the sorted arrays past this share of them
+COMPACT_MIN      = 10000
+EPOCH            = datetime(1970, 1, 1)
+
+def tokens(text):
+    """Words and adjacent word pairs, so "bass guitar" and "electric guitar" stay apart."""
+    words = [word for word in TOKEN.findall(html.unescape(text or "").lower()) if word not in STOP_WORDS]
+    return words + [first + " " + second for first, second in zip(words, words[1:])]
+
+def location_term(location):
+    return "@" + " ".join(TOKEN.findall(html.unescape(location or "").lower())) if location else None
+
+def gig_terms(title, description, location):
+    terms = Counter()
+    for term in tokens(title):
+        terms[term] += TITLE_WEIGHT
+    terms.update(tokens(description))
+    if location_term(location):
+        terms[location_term(location)] += 1
+    return terms
+
+def musician_terms(musician):
+    terms = Counter(tokens(musician.description))
+    if location_term(musician.location):
+        terms[location_term(musician.location)] += 1
+    return terms
+
+def _seconds(timestamp):
+    return (timestamp - EPOCH).total_seconds() if timestamp is not None else 0.0
+
+def _grow(array_, size, fill=0):
+    import numpy as np
+    if size <= len(array_):
+        return array_
+    grown = np.full(max(size, len(array_) * 2), fill, dtype=array_.dtype)
+    grown[:len(array_)] = array_
+    return grown
+
+
+class GigIndex():
+    """TF-IDF vectors of every gig. Built once from the database, then gigs created or edited since are
+    appended, with the superseded row of an edited gig masked out. IDF is fixed at build time for the
+    terms known then, later terms get theirs when first seen."""
+
+    def __init__(self):
+        self.lock      = threading.RLock()
+        self.ready     = False
+        self.builder   = None # the thread building the index
+        self.synced_at = 0
+
+    def build(self):
+        import numpy as np
+        vocabulary, df = {}, array("q")
+        term_ids, rows, counts = array("q"), array("q"), array("f")
+        gig_ids, updated = array("q"), array("d")
+        watermark = 0.0
+        query = db.select([Gig.id, Gig.title, Gig.description, Gig.location, Gig.updated_at]).order_by(Gig.id)
+        for row, (gig_id, title, description, location, updated_at) in enumerate(db.session.execute(query)):
+            for term, count in gig_terms(title, description, location).items():
+                term_id = vocabulary.get(term)
+                if term_id is None:
+                    term_id = vocabulary[term] = len(df)
+                    df.append(0)
+                df[term_id] += 1
+                term_ids.append(term_id)
+                rows.append(row)
+                counts.append(count)
+            gig_ids.append(gig_id)
+            updated.append(_seconds(updated_at))
+            watermark = max(watermark, updated[-1])
+
+        self.vocabulary = vocabulary
+        self.df         = np.array(df, dtype=np.int64)
+        self.documents  = len(gig_ids)
+        self.rows       = len(gig_ids)
+        self.gig_ids    = np.array(gig_ids, dtype=np.int64)
+        self.updated    = np.array(updated, dtype=np.float64)
+        self.alive      = np.ones(self.rows, dtype=bool)
+        self.row_of     = np.full(int(self.gig_ids.max()) + 1 if self.rows else 0, -1, dtype=np.int64) # gig id -> row
+        self.row_of[self.gig_ids] = np.arange(self.rows)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        rows     = np.array(rows, dtype=np.int64)
+        weights  = (1 + np.log(np.array(counts, dtype=np.float32))) * self.idf()[term_ids]
+        norms    = np.sqrt(np.bincount(rows, weights * weights, minlength=self.rows))
+        weights  = (weights / norms[rows]).astype(np.float32)
+        self._set_postings(term_ids, rows, weights)
+        self.watermark = watermark
+        self.synced_at = time.monotonic()
+        self.ready     = True
+
+    def _set_postings(self, term_ids, rows, weights):
+        import numpy as np
+        order = np.argsort(term_ids, kind="stable")
+        self.postings     = rows[order].astype(np.int32)
+        self.weights      = weights[order]
+        self.offsets      = np.concatenate(([0], np.cumsum(np.bincount(term_ids, minlength=len(self.df)))))
+        self.appended     = {} # term id -> (rows, weights) added since the last compaction
+        self.appended_len = 0
+
+    def idf(self, term_ids=None):
+        import numpy as np
+        df = self.df if term_ids is None else self.df[term_ids]
+        return (np.log((1 + self.documents) / (1 + df)) + 1).astype(np.float32)
+
+    def vector(self, terms, add_terms=False):
+        """Term ids and unit length TF-IDF weights of a bag of terms."""
+        import numpy as np
+        term_ids, counts = [], []
+        for term, count in terms.items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                if not add_terms:
+                    continue
+                term_id = self.vocabulary[term] = len(self.vocabulary)
+                self.df = _grow(self.df, term_id + 1)
+            term_ids.append(term_id)
+            counts.append(count)
+        term_ids = np.array(term_ids, dtype=np.int64)
+        weights  = (1 + np.log(np.array(counts, dtype=np.float32))) * self.idf(term_ids)
+        norm     = math.sqrt(float(np.dot(weights, weights)))
+        return term_ids, weights / norm if norm else weights
+
+    def add(self, gig_id, title, description, location, updated_at):
+        row = self.rows
+        old = self.row_of[gig_id] if gig_id < len(self.row_of) else -1
+        if old >= 0:
+            self.alive[old] = False # the edited version replaces it
+        else:
+            self.documents += 1
+        term_ids, weights = self.vector(gig_terms(title, description, location), add_terms=True)
+        if old < 0:
+            self.df[term_ids] += 1
+
+        self.rows    = row + 1
+        self.gig_ids = _grow(self.gig_ids, self.rows)
+        self.updated = _grow(self.updated, self.rows)
+        self.alive   = _grow(self.alive, self.rows, False)
+        self.row_of  = _grow(self.row_of, gig_id + 1, -1)
+        self.gig_ids[row], self.updated[row], self.alive[row] = gig_id, _seconds(updated_at), True
+        self.row_of[gig_id] = row
+        for term_id, weight in zip(term_ids.tolist(), weights.tolist()):
+            appended = self.appended.setdefault(term_id, (array("q"), array("f")))
+            appended[0].append(row)
+            appended[1].append(weight)
+        self.appended_len += len(term_ids)
+        if self.appended_len > max(COMPACT_MIN, COMPACT_FRACTION * len(self.postings)):
+            self.compact()
+
+    def compact(self):
+        """Merges the appended postings into the sorted arrays."""
+        import numpy as np
+        term_ids, rows, weights = [self._posting_terms()], [self.postings.astype(np.int64)], [self.weights]
+        for term_id, (appended_rows, appended_weights) in self.appended.items():
+            term_ids.append(np.full(len(appended_rows), term_id, dtype=np.int64))
+            rows.append(np.frombuffer(appended_rows, dtype=np.int64))
+            weights.append(np.frombuffer(appended_weights, dtype=np.float32))
+        self._set_postings(np.concatenate(term_ids), np.concatenate(rows), np.concatenate(weights))
+
+    def _posting_terms(self):
+        import numpy as np
+        return np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))
+
+    def sync(self):
+        """Indexes the gigs created or edited in any process since the last sync."""
+        since = datetime.utcfromtimestamp(max(self.watermark - SYNC_OVERLAP, 0))
+        query = (db.select([Gig.id, Gig.title, Gig.description, Gig.location, Gig.updated_at])
+                 .where(Gig.updated_at > since).order_by(Gig.updated_at))
+        for gig_id, title, description, location, updated_at in db.session.execute(query):
+            seconds = _seconds(updated_at)
+            row = self.row_of[gig_id] if gig_id < len(self.row_of) else -1
+            if row < 0 or self.updated[row] < seconds:
+                self.add(gig_id, title, description, location, updated_at)
+            self.watermark = max(self.watermark, seconds)
+        self.synced_at = time.monotonic()
+
+    def scores(self, terms):
+        import numpy as np
+        scores = np.zeros(self.rows, dtype=np.float32)
+        term_ids, weights = self.vector(terms)
+        for term_id, weight in zip(term_ids.tolist(), weights.tolist()):
+            if self.df[term_id] > MAX_DF * self.documents:
+                continue
+            if term_id + 1 < len(self.offsets):
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                scores[self.postings[start:end]] += weight * self.weights[start:end] # a gig has a term once, rows don't repeat
+            appended = self.appended.get(term_id)
+            if appended:
+                scores[np.frombuffer(appended[0], dtype=np.int64)] += weight * np.frombuffer(appended[1], dtype=np.float32)
+        return scores
+
+    def top(self, terms, k, exclude=()):
+        """The ids of the k best matching gigs, best first, leaving out `exclude` and gigs sharing no term."""
+        import numpy as np
+        scores = self.scores(terms)
+        excluded = np.array([gig_id for gig_id in exclude if gig_id < len(self.row_of)], dtype=np.int64)
+        if len(excluded):
+            scores[self.row_of[excluded][self.row_of[excluded] >= 0]] = 0
+        candidates = np.flatnonzero(scores > 0) # a boolean mask is scanned several times faster than floats
+        candidates = candidates[self.alive[candidates]]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return self.gig_ids[candidates].tolist()
+
+
+class Recommender():
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["recommender"] = GigIndex()
+
+    def index(self, app=None, wait=False):
+        """The app's index, synced at most every RECOMMEND_SYNC_SECONDS. The first call starts building it
+        in a background thread, and until it is built None is returned, so no request waits for the build.
+        With `wait` the caller waits for it instead."""
+        app   = app or current_app._get_current_object() # the build thread has no app context of its own
+        index = app.extensions["recommender"]
+        if not index.ready:
+            builder = self._start_build(app, index)
+            if not wait:
+                return None
+            builder.join()
+            if not index.ready:
+                raise RuntimeError("Building the recommendation index failed, see the log")
+        with index.lock:
+            if time.monotonic() - index.synced_at > app.config["RECOMMEND_SYNC_SECONDS"]:
+                index.sync()
+        return index
+
+    def _start_build(self, app, index):
+        with index.lock:
+            if index.builder is None or not index.builder.is_alive():
+                index.builder = threading.Thread(target=self._build, args=(app, index), name="recommend-index", daemon=True)
+                index.builder.start()
+            return index.builder
+
+    def _build(self, app, index):
+        with app.app_context():
+            try:
+                index.build()
+            except Exception:
+                app.logger.exception("Building the recommendation index failed") # the next request tries again
+            finally:
+                db.session.remove()
+
+    def recommend(self, musician, k):
+        """Up to k gigs matching the musician's description and location, leaving out the ones applied to.
+        None while the index is being built."""
+        index = self.index()
+        if index is None:
+            return None
+        with index.lock:
+            # over-fetched, as gigs deleted since the build are only dropped below
+            ids = index.top(musician_terms(musician), k + 10, exclude=musician.applied_gig_ids())
+        gigs = {gig.id: gig for gig in Gig.query.options(db.joinedload(Gig.employer)).filter(Gig.id.in_(ids))}
+        return [gigs[gig_id] for gig_id in ids if gig_id in gigs][:k]
+
+recommender = Recommender()
+
+
+@click.command("recommend")
+@click.argument("email")
+@click.option("--count", default=10, show_default=True, help="Number of gigs to recommend.")
+@with_appcontext
+def recommend_command(email, count):
+    """Print the gigs recommended to a musician, and how long building the index took."""
+    from app.models import User
+    musician = User.query.filter_by(email=email).first()
+    if musician is None:
+        raise click.BadParameter("no user with that email", param_hint="email")
+    started = time.perf_counter()
+    recommender.index(wait=True)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    gigs = recommender.recommend(musician, count)
+    print("Index built in %.2fs, recommended in %.1fms" % (built, (time.perf_counter() - started) * 1000))
+    for gig in gigs:
+        print("%s  %s (%s)" % (gig.slug, gig.title, gig.location))
@@ -0,0 +1,39 @@
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import applications, insert_ignore
+from app.counters import reconcile_counters
+from app.analytics import create_analytics_schema, rebuild_analytics
+
+# Data migrations that autogenerated Flask-Migrate revisions can't express.
+
+def upgrade_applications():
+    """Rebuilds a pre-primary-key applications table without its duplicate rows.
+    Every step can be rerun, so an interrupted upgrade is finished by running it again."""
+    engine = db.get_engine()
+    inspector = db.inspect(engine)
+    tables = inspector.get_table_names()
+    if "applications" in tables and "applications_old" not in tables:
+        if inspector.get_pk_constraint("applications")["constrained_columns"]:
+            return 0
+        db.session.execute(db.text("ALTER TABLE applications RENAME TO applications_old"))
+        db.session.commit()
+
+    applications.create(engine, checkfirst=True)
+    old = db.table("applications_old", db.column("gig_id"), db.column("musician_id"))
+    before = db.session.execute(db.select([db.func.count()]).select_from(old)).scalar()
+    rows = db.select([old.c.gig_id, old.c.musician_id]).where(db.and_(old.c.gig_id.isnot(None), old.c.musician_id.isnot(None))).distinct()
+    db.session.execute(insert_ignore(applications).from_select(["gig_id", "musician_id"], rows))
+    db.session.execute(db.text("DROP TABLE applications_old"))
+    db.session.commit()
+    after = db.session.execute(db.select([db.func.count()]).select_from(applications)).scalar()
+    reconcile_counters() # duplicates were counted too
+    create_analytics_schema()
+    rebuild_analytics()
+    return before - after
+
+@click.command("upgrade-applications")
+@with_appcontext
+def upgrade_applications_command():
+    """Add the applications primary key and index, dropping duplicate applications."""
+    print("Removed %d duplicate or incomplete applications" % upgrade_applications())
@@ -1,108 +1,165 @@
 import random
-from sqlalchemy.exc import IntegrityError
-from faker import Faker
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from slugify import slugify
+from werkzeug.security import generate_password_hash
 from app import db
-from app.models import User, Gig, Role
+from app.models import User, Gig, Role, applications
+from app.analytics import rebuild_analytics
 
-def seed_db(num_of_employers=20, num_of_gigs=30, num_of_musicians=20):
-    num_of_users = User.query.count()
+FAKE_POOL_SIZE = 1000 # faker is too slow to call per row, rows pick from pools of generated values
+APPLICATION_DAYS = 30 # seeded applications are spread over this many past days
 
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _bulk_insert(table, rows, batch_size, label):
+    print("Creating " + label + "...")
+    started = time.perf_counter()
+    count = 0
+    for chunk in _chunks(rows, batch_size):
+        db.session.execute(table.insert(), chunk) # executemany, one transaction per batch
+        db.session.commit()
+        count += len(chunk)
+        print("Created: " + str(count), end="\r")
+    elapsed = time.perf_counter() - started
+    print("Finished creating %d %s in %.2fs (%d rows/sec)" % (count, label, elapsed, count / elapsed if elapsed else 0))
+    return count
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+def _user_rows(rng, fake, first_id, count, role_id, password_hash, names, intro):
+    cities     = [fake.city() for _ in range(FAKE_POOL_SIZE)]
+    paragraphs = [fake.paragraph(3, True) for _ in range(FAKE_POOL_SIZE)]
+    for user_id in range(first_id, first_id + count):
+        name = rng.choice(names)
+        yield {
+            "id": user_id,
+            "username": "%s %d" % (name, user_id) if " " in name else "%s%d" % (name, user_id),
+            "email": "user%d@globomantics.test" % user_id,
+            "password_hash": password_hash,
+            "location": rng.choice(cities),
+            "description": intro + rng.choice(paragraphs),
+            "role_id": role_id,
+            "activated": True
+        }
+
+def _gig_rows(rng, fake, first_id, count, employer_ids, applicant_count, gig_counts):
+    cities = [fake.city() for _ in range(FAKE_POOL_SIZE)]
+    slugs  = {}
+    for gig_id in range(first_id, first_id + count):
+        title = random_gig_title(rng)
+        if title not in slugs:
+            slugs[title] = slugify(title)
+        employer_id = rng.choice(employer_ids)
+        gig_counts[employer_id] += 1
+        yield {
+            "id": gig_id,
+            "title": title,
+            "description": random_gig_description(title, rng),
+            "payment": round(rng.uniform(100, 2000), 2),
+            "location": rng.choice(cities),
+            "employer_id": employer_id,
+            "slug": "%s-%x" % (slugs[title], gig_id), # the id suffix keeps slugs unique without a lookup
+            "applicant_count": applicant_count
+        }
+
+def _application_rows(rng, gig_ids, musician_ids, per_gig, application_counts):
+    now = datetime.utcnow()
+    for gig_id in gig_ids:
+        for musician_id in rng.sample(musician_ids, per_gig):
+            application_counts[musician_id] += 1
+            applied_at = now - timedelta(seconds=rng.randrange(APPLICATION_DAYS * 24 * 60 * 60))
+            yield {"gig_id": gig_id, "musician_id": musician_id, "applied_at": applied_at}
+
+def _update_counts(column, counts, batch_size):
+    # the bulk inserts bypass the ORM events that maintain the counters, so they are filled in here
+    table = User.__table__
+    rows  = ({"counted_id": user_id, "count": count} for user_id, count in counts.items())
+    for chunk in _chunks(rows, batch_size):
+        db.session.execute(table.update().where(table.c.id == db.bindparam("counted_id"))
+                           .values({column: table.c[column] + db.bindparam("count")}), chunk)
+        db.session.commit()
+
+def seed_db(num_of_employers=20, num_of_gigs=30, num_of_musicians=20, num_of_applications=None, seed=None, batch_size=5000):
+    if num_of_applications is None:
+        num_of_applications = int(num_of_musicians/2)
+
+    from faker import Faker # only seeding needs it, and it is slow to import
+    rng  = random.Random(seed)
     fake = Faker()
-    i = 0
-    print("Creating employers...")
-    print("Created: 0", end="\r")
-    while i < num_of_employers:
-        e = User(
-                username=fake.company(),
-                email=fake.email(),
-                password='password123',
-                location=fake.city(),
-                description="We sometimes put up gig offers. Here are some random words: " + fake.paragraph(3, True),
-                role_id=Role.EMPLOYER
-            )
-        e.activated = True
-        db.session.add(e)
-        try:
-            db.session.commit()
-            i += 1
-            print("Created: " + str(i), end="\r")
-        except IntegrityError:
-            db.session.rollback()
-    print("Finished creating " + str(num_of_employers) + " employers...")
-    print("\n")
-
-    i = 0
-    print("Creating gigs...")
-    print("Created: 0", end="\r")
-    employer_ids = db.session.query(User.id).filter_by(role_id=3).all()
-    while i < num_of_gigs:
-        random_title = random_gig_title()
-        g = Gig(
-                title=random_title,
-                description=random_gig_description(random_title),
-                payment=round(random.uniform(100, 2000),2),
-                location=fake.city(),
-                employer_id=random.choice(employer_ids)[0]
-            )
-        db.session.add(g)
+    if seed is not None:
+        fake.seed_instance(seed)
+
+    started = time.perf_counter()
+    password_hash = generate_password_hash("password123") # every seeded user shares one password, hash it once
+    total = 0
+
+    first_employer = _next_id(User)
+    companies = [fake.company() for _ in range(FAKE_POOL_SIZE)]
+    total += _bulk_insert(User.__table__, _user_rows(rng, fake, first_employer, num_of_employers, Role.EMPLOYER, password_hash,
+                          companies, "We sometimes put up gig offers. Here are some random words: "), batch_size, "employers")
+    employer_ids = list(range(first_employer, first_employer + num_of_employers))
+
+    first_musician = _next_id(User)
+    user_names = [fake.user_name() for _ in range(FAKE_POOL_SIZE)]
+    total += _bulk_insert(User.__table__, _user_rows(rng, fake, first_musician, num_of_musicians, Role.MUSICIAN, password_hash,
+                          user_names, "I am ready to make some music! Please hire me. Here are some random words: "), batch_size, "musicians")
+    musician_ids = list(range(first_musician, first_musician + num_of_musicians))
+
+    first_gig = _next_id(Gig)
+    if employer_ids:
+        per_gig = min(num_of_applications, len(musician_ids))
+        gig_counts, application_counts = Counter(), Counter()
+        total += _bulk_insert(Gig.__table__, _gig_rows(rng, fake, first_gig, num_of_gigs, employer_ids, per_gig, gig_counts),
+                              batch_size, "gigs")
+        gig_ids = range(first_gig, first_gig + num_of_gigs)
+        if per_gig:
+            total += _bulk_insert(applications, _application_rows(rng, gig_ids, musician_ids, per_gig, application_counts),
+                                  batch_size, "applications")
+        _update_counts("gig_count", gig_counts, batch_size)
+        _update_counts("application_count", application_counts, batch_size)
+        print("Rebuilding employer analytics...")
+        rebuild_analytics()
+
+    if not User.query.filter_by(email="admin@mail.com").first():
+        print("Creating admin user...")
+        print("Login info for admin:")
+        print("Email: admin@mail.com")
+        print("Password: password123")
+        admin = User("admin", "admin@mail.com", "password123", "Nowhere", "I am admin", Role.ADMIN)
+        db.session.add(admin)
         db.session.commit()
-        i += 1
-        print("Created: " + str(i), end="\r")
-    print("Finished creating " + str(num_of_gigs) + " gigs...")
-    print("\n")
-
-    i = 0
-    print("Creating musicians...")
-    print("Created: 0", end="\r")
-    while i < num_of_musicians:
-        m = User(
-                username=fake.user_name(),
-                email=fake.email(),
-                password='password123',
-                location=fake.city(),
-                description="I am ready to make some music! Please hire me. Here are some random words: " + fake.paragraph(3, True),
-                role_id=Role.MUSICIAN
-            )
-        m.activated = True
-        db.session.add(m)
-        try:
-            db.session.commit()
-            i += 1
-            print("Created: " + str(i), end="\r")
-        except IntegrityError:
-            db.session.rollback()
-    print("Finished creating " + str(num_of_musicians) + " musicians...")
-    print("\n")
-
-    i = 0
-    print("Applying musicians to gigs...")
-    num_of_applications = int(num_of_musicians/2)
-    print("Will create " + str(num_of_applications*num_of_gigs) + " applications.")
-    musician_ids = db.session.query(User.id).filter_by(role_id=2).all()
-    while i < num_of_gigs:
-        g = Gig.query.get(i+1)
-        j = 0
-        while j < num_of_applications:
-            m = User.query.get(random.choice(musician_ids)[0])
-            try:
-                m.apply(g)
-                db.session.commit()
-                j += 1
-            except IntegrityError:
-                db.session.rollback()
-        i += 1
-
-    print("\n")
-    print("Creating admin user...")
-    print("\n")
-    print("Login info for admin:")
-    print("Email: admin@mail.com")
-    print("Password: pass")
-    print("\n")
-    admin = User("admin", "admin@mail.com", "password123", "Nowhere", "I am admin", Role.ADMIN)
-    db.session.add(admin)
-    db.session.commit()
-    print("Database is ready!")
+
+    elapsed = time.perf_counter() - started
+    print("Database is ready! %d rows in %.2fs (%d rows/sec)" % (total, elapsed, total / elapsed if elapsed else 0))
+    return total
+
+@click.command("seed")
+@click.option("--employers", default=20, show_default=True, help="Number of employers to create.")
+@click.option("--gigs", default=30, show_default=True, help="Number of gigs to create.")
+@click.option("--musicians", default=20, show_default=True, help="Number of musicians to create.")
+@click.option("--applications", "applications_per_gig", default=None, type=int, help="Applications per gig (defaults to half of the musicians).")
+@click.option("--seed", default=None, type=int, help="Random seed for reproducible data.")
+@click.option("--batch-size", default=5000, show_default=True, help="Rows inserted per transaction.")
+@click.option("--create-tables", is_flag=True, help="Create missing tables before seeding.")
+@with_appcontext
+def seed_command(employers, gigs, musicians, applications_per_gig, seed, batch_size, create_tables):
+    """Fill the database with fake employers, musicians, gigs and applications."""
+    if create_tables:
+        db.create_all()
+    seed_db(employers, gigs, musicians, applications_per_gig, seed, batch_size)
 
 instruments = [
     "Handpan",
@@ -188,8 +245,8 @@ description = [
     "Hello, we need someone ASAP."
 ]
 
-def random_gig_title():
-    return random.choice(titles) + " " + random.choice(instruments) + " player for " + random.choice(gig_types)
+def random_gig_title(rng=random):
+    return rng.choice(titles) + " " + rng.choice(instruments) + " player for " + rng.choice(gig_types)
 
-def random_gig_description(title):
-    return random.choice(description) + " " + title
+def random_gig_description(title, rng=random):
+    return rng.choice(description) + " " + title
@@ -0,0 +1,74 @@
+"""Response compression: bytes saved against CPU time per page.
+
+Renders the musician home feed, the employer's my_gigs page and a JSON API page from a
+seeded database, then compresses each body with every encoding and level the middleware
+can use (brotli only when the package is installed):
+
+    python benchmarks/bench_compression.py --size 1k --per-page 200 --output bench_compression.json
+"""
+import argparse
+import time
+
+from common import SIZES, make_app, ensure_seeded, sample_users, login, write_results
+from app.compression import compress, _brotli
+
+LEVELS = {
+    "gzip": (1, 6, 9),
+    "br": (1, 4, 11),
+}
+
+
+def pages(app):
+    musician_email, employer_email, _ = sample_users(app)
+    musician = login(app.test_client(), musician_email)
+    employer = login(app.test_client(), employer_email)
+    bodies = {
+        "main.home (musician)": musician.get("/"),
+        "gig.my_gigs (employer)": employer.get("/gig/my_gigs"),
+        "api.gigs": musician.get("/api/gigs?limit=%d" % app.config["API_MAX_PER_PAGE"]),
+    }
+    for name, response in bodies.items():
+        assert response.status_code == 200 and "Content-Encoding" not in response.headers, name
+    return {name: response.get_data() for name, response in bodies.items()}
+
+
+def measure(data, encoding, level, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        compressed = compress(encoding, data, level)
+    cpu = (time.process_time() - started) / repeat
+    return {
+        "bytes": len(data),
+        "compressed_bytes": len(compressed),
+        "saved_percent": round((1 - len(compressed) / len(data)) * 100, 1),
+        "cpu_ms": round(cpu * 1000, 3),
+        "mb_per_cpu_sec": round(len(data) / cpu / 1e6, 1) if cpu else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="1k", choices=sorted(SIZES))
+    parser.add_argument("--per-page", type=int, default=200, help="gig cards on the home feed")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default="bench_compression.json")
+    args = parser.parse_args()
+
+    # compression is switched off so the pages come back as the identity encoding
+    app = make_app(args.size, COMPRESS_ENABLED=False, FEED_PER_PAGE=args.per_page, API_MAX_PER_PAGE=args.per_page)
+    ensure_seeded(app, args.size)
+
+    encodings = [encoding for encoding in LEVELS if encoding != "br" or _brotli() is not None]
+    results = {}
+    for page, data in pages(app).items():
+        results[page] = {}
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                stats = results[page]["%s-%d" % (encoding, level)] = measure(data, encoding, level, args.repeat)
+                print("%-24s %-8s %8d -> %7d bytes (%5.1f%% saved)  %7.3f ms CPU" % (
+                    page, "%s-%d" % (encoding, level), stats["bytes"], stats["compressed_bytes"], stats["saved_percent"], stats["cpu_ms"]))
+    write_results(args.output, "compression", {args.size: results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Bulk gig import: rows per second and memory of importing generated CSV and JSON lines files.
+
+Writes files of `--rows` gigs, one row in `--invalid` failing validation, and imports each into a copy
+of the seeded database for its first employer, through the same code as `flask import-gigs`. With
+--trace-memory the peak memory of the import is reported too, at about half the speed:
+
+    python benchmarks/bench_import.py --size 100k --rows 100000 --output bench_import.json
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from common import SIZES, make_app, ensure_seeded, database_path, write_results
+from app import db
+from app.models import User, Role
+from app.gig.imports import import_gigs, FIELDS
+from app.seed import random_gig_title, random_gig_description
+
+LOCATIONS = ["Boston", "Chicago", "Denver", "Austin", "Seattle", "Portland", "Nashville", "Detroit"]
+
+
+def gig_rows(count, invalid, seed=1):
+    rng = random.Random(seed)
+    for index in range(count):
+        title = random_gig_title(rng)
+        yield {
+            "title": title if invalid == 0 or index % invalid else "Gig", # too short
+            "description": random_gig_description(title, rng)[:200],
+            "payment": "%.2f" % rng.uniform(50, 2000),
+            "location": rng.choice(LOCATIONS),
+        }
+
+
+def write_file(path, format, rows):
+    with open(path, "w", newline="") as f:
+        if format == "csv":
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+def run_import(app, path, format, batch_size, trace_memory):
+    with app.app_context():
+        employer_id = User.query.filter_by(role_id=Role.EMPLOYER).first().id
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with open(path, "rb") as stream:
+            for report in import_gigs(stream, employer_id, format, batch_size):
+                pass
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        tracemalloc.stop()
+        db.session.remove()
+    return {
+        "imported": report["imported"],
+        "rejected": report["rejected"],
+        "elapsed_sec": round(elapsed, 2),
+        "rows_per_sec": round((report["imported"] + report["rejected"]) / elapsed),
+        "peak_mb": round(peak / 1e6, 1) if peak is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="100k", choices=sorted(SIZES))
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--invalid", type=int, default=100, help="every nth row is invalid, 0 for none")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--format", action="append", choices=("csv", "jsonl"), default=[])
+    parser.add_argument("--trace-memory", action="store_true")
+    parser.add_argument("--output", default="bench_import.json")
+    args = parser.parse_args()
+
+    ensure_seeded(make_app(args.size), args.size)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for format in args.format or ["csv", "jsonl"]:
+            path = os.path.join(directory, "gigs." + format)
+            write_file(path, format, gig_rows(args.rows, args.invalid))
+            copy = os.path.join(directory, "import.sqlite") # the seeded database stays as it was
+            shutil.copyfile(database_path(args.size), copy)
+            stats = results[format] = run_import(make_app(args.size, SQLALCHEMY_DATABASE_URI="sqlite:///" + copy),
+                                                 path, format, args.batch_size, args.trace_memory)
+            stats["file_mb"] = round(os.path.getsize(path) / 1e6, 1)
+            print("%-5s %7d imported  %5d rejected  %6.2fs  %7d rows/sec  file %.1f MB%s" % (
+                format, stats["imported"], stats["rejected"], stats["elapsed_sec"], stats["rows_per_sec"], stats["file_mb"],
+                "  peak %.1f MB" % stats["peak_mb"] if args.trace_memory else ""))
+    write_results(args.output, "import", {args.size: results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Mail delivery throughput: one SMTP connection per mail against outbox batches over a reused connection.
+
+Runs against the local SMTP stand-in in smtp_stub.py, --connect-delay simulates the
+handshake cost of a real server:
+
+    python benchmarks/bench_outbox.py --mails 500 --connect-delay 0.005 --output bench_outbox.json
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import make_app, write_results
+from smtp_stub import SMTPStub
+from app import db, mail
+from app.emails import flush_outbox, send_mail
+from app.models import OutboxMail
+
+
+def setup_app(stub, database):
+    app = make_app("outbox", SQLALCHEMY_DATABASE_URI="sqlite:///" + database, MAIL_PORT=stub.port, MAIL_DISPATCH="sync",
+                   MAIL_SUPPRESS_SEND=False)
+    mail.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def send_mails(count):
+    for i in range(count):
+        send_mail("musician%d@globomantics.test" % i, "Confirm your account", "emails/auth/confirm",
+                  username="musician%d" % i, role=2, activation_link="http://localhost/activate/token%d" % i)
+
+
+def bench_sync(app, stub, count):
+    with app.app_context():
+        started = time.perf_counter()
+        send_mails(count)
+        return time.perf_counter() - started
+
+
+def bench_outbox(app, stub, count, batch_size):
+    with app.app_context():
+        app.config["MAIL_DISPATCH"] = "outbox"
+        started = time.perf_counter()
+        send_mails(count)
+        db.session.commit()
+        enqueued = time.perf_counter() - started
+        sent, failed = flush_outbox(batch_size)
+        assert sent == count and not failed, (sent, failed)
+        OutboxMail.query.delete()
+        db.session.commit()
+        return enqueued, time.perf_counter() - started - enqueued
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mails", type=int, default=500)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--connect-delay", type=float, default=0.005, help="seconds the stand-in waits before its greeting")
+    parser.add_argument("--output", default="bench_outbox.json")
+    args = parser.parse_args()
+
+    stub = SMTPStub(connect_delay=args.connect_delay).start()
+    database = os.path.join(tempfile.mkdtemp(), "outbox.sqlite")
+    app = setup_app(stub, database)
+    results = {}
+
+    connections = stub.connections
+    elapsed = bench_sync(app, stub, args.mails)
+    results["sync, connection per mail"] = {"seconds": round(elapsed, 3), "mails_per_sec": round(args.mails / elapsed, 1),
+                                            "smtp_connections": stub.connections - connections}
+
+    for batch_size in args.batch_sizes:
+        connections = stub.connections
+        enqueued, flushed = bench_outbox(app, stub, args.mails, batch_size)
+        results["outbox, batch %d" % batch_size] = {"enqueue_seconds": round(enqueued, 3), "seconds": round(flushed, 3),
+                                                     "mails_per_sec": round(args.mails / flushed, 1),
+                                                     "smtp_connections": stub.connections - connections}
+
+    for name, stats in results.items():
+        print("%-28s %8.1f mails/sec  %5d connections" % (name, stats["mails_per_sec"], stats["smtp_connections"]))
+    write_results(args.output, "outbox", {"%d mails" % args.mails: results})
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
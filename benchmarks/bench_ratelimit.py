@@ -0,0 +1,88 @@
+"""Auth rate limiter: CPU spent on a credential stuffing burst with the limiter off and on.
+
+A few client addresses post wrong passwords for seeded musician accounts as fast as they can.
+Every attempt that reaches the login view hashes a password, so the CPU time of the burst is
+mostly PBKDF2. Afterwards a legitimate musician logs in from another address:
+
+    python benchmarks/bench_ratelimit.py --size 1k --attempts 300 --clients 3 --output bench_ratelimit.json
+"""
+import argparse
+import itertools
+import time
+
+from common import SIZES, PASSWORD, make_app, ensure_seeded, write_results
+from app.models import User, Role
+
+MODES = {
+    "off": dict(RATELIMIT_ENABLED=False),
+    "memory": dict(RATELIMIT_ENABLED=True, RATELIMIT_BACKEND="memory"),
+}
+
+
+def musician_emails(app, count):
+    with app.app_context():
+        query = User.query.filter_by(role_id=Role.MUSICIAN).order_by(User.id).limit(count + 1)
+        emails = [user.email for user in query]
+    return emails[:-1], emails[-1]
+
+
+def stuffing(app, targets, attempts, clients):
+    client = app.test_client()
+    addresses = itertools.cycle(["203.0.113.%d" % (index + 1) for index in range(clients)])
+    emails = itertools.cycle(targets)
+    statuses = {}
+    cpu_started, started = time.process_time(), time.perf_counter()
+    for _ in range(attempts):
+        response = client.post("/login", data=dict(email=next(emails), password="wrong-password"),
+                               environ_base={"REMOTE_ADDR": next(addresses)})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    cpu, elapsed = time.process_time() - cpu_started, time.perf_counter() - started
+    return {
+        "attempts": attempts,
+        "rejected": statuses.get(429, 0),
+        "checked": statuses.get(200, 0),
+        "cpu_sec": round(cpu, 3),
+        "cpu_ms_per_attempt": round(cpu / attempts * 1000, 3),
+        "elapsed_sec": round(elapsed, 3),
+    }
+
+
+def legitimate_login(app, email):
+    response = app.test_client().post("/login", data=dict(email=email, password=PASSWORD),
+                                      environ_base={"REMOTE_ADDR": "198.51.100.7"})
+    return response.status_code == 302
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="1k", choices=sorted(SIZES))
+    parser.add_argument("--attempts", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=3, help="attacking client addresses")
+    parser.add_argument("--targets", type=int, default=50, help="accounts the attempts rotate through")
+    parser.add_argument("--backend", action="append", choices=("sqlite", "redis"), default=[],
+                        help="also measure a shared backend")
+    parser.add_argument("--output", default="bench_ratelimit.json")
+    args = parser.parse_args()
+
+    modes = dict(MODES)
+    for backend in args.backend:
+        modes[backend] = dict(RATELIMIT_ENABLED=True, RATELIMIT_BACKEND=backend)
+
+    results = {}
+    for mode, config in modes.items():
+        app = make_app(args.size, **config)
+        ensure_seeded(app, args.size)
+        if mode == "sqlite":
+            from app.auth.ratelimit import limiter
+            limiter.backend.clear() # buckets outlive the run in the file
+        targets, legitimate = musician_emails(app, args.targets)
+        stats = results[mode] = stuffing(app, targets, args.attempts, args.clients)
+        stats["legitimate_login"] = legitimate_login(app, legitimate)
+        print("%-8s %5d attempts  %5d rejected  %7.3f s CPU (%6.3f ms each)  legitimate login %s" % (
+            mode, stats["attempts"], stats["rejected"], stats["cpu_sec"], stats["cpu_ms_per_attempt"],
+            "ok" if stats["legitimate_login"] else "FAILED"))
+    write_results(args.output, "ratelimit", {args.size: results})
+
+
+if __name__ == "__main__":
+    main()
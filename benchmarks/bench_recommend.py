@@ -0,0 +1,91 @@
+"""Gig recommendations: index build time and memory, and per-musician scoring latency.
+
+Builds the TF-IDF index of a seeded database, then scores musician profiles made of
+instruments and gig locations (seeded descriptions are lorem ipsum) and reports the latency
+of the top-k selection alone and of the full feed query, which also loads the gigs:
+
+    python benchmarks/bench_recommend.py --size 100k --musicians 200 --k 6 --output bench_recommend.json
+"""
+import argparse
+import random
+import time
+
+from common import SIZES, make_app, ensure_seeded, summarize, write_results
+from app import db
+from app.models import User, Gig, Role
+from app.recommend import recommender, musician_terms
+from app.seed import instruments
+
+
+class Profile():
+    def __init__(self, description, location):
+        self.description = description
+        self.location    = location
+
+
+def profiles(app, count, seed=1):
+    rng = random.Random(seed)
+    with app.app_context():
+        locations = [location for location, in db.session.query(Gig.location).limit(1000)]
+    return [Profile("I play the %s and the %s, weddings and parties." % tuple(rng.sample(instruments, 2)), rng.choice(locations))
+            for _ in range(count)]
+
+
+def index_bytes(index):
+    arrays = (index.postings, index.weights, index.offsets, index.df, index.gig_ids, index.updated, index.alive, index.row_of)
+    return sum(array.nbytes for array in arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="100k", choices=sorted(SIZES))
+    parser.add_argument("--musicians", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--output", default="bench_recommend.json")
+    args = parser.parse_args()
+
+    app = make_app(args.size)
+    ensure_seeded(app, args.size)
+    sample = profiles(app, args.musicians)
+
+    with app.app_context():
+        started = time.perf_counter()
+        index = recommender.index(app, wait=True)
+        build_sec = time.perf_counter() - started
+
+        latencies = []
+        for profile in sample:
+            started = time.perf_counter()
+            index.top(musician_terms(profile), args.k)
+            latencies.append(time.perf_counter() - started)
+        top_k = summarize(latencies, sum(latencies))
+
+        musicians = User.query.filter_by(role_id=Role.MUSICIAN).limit(args.musicians).all()
+        for musician, profile in zip(musicians, sample):
+            musician.description, musician.location = profile.description, profile.location # not committed
+        latencies = []
+        for musician in musicians:
+            started = time.perf_counter()
+            recommender.recommend(musician, args.k)
+            latencies.append(time.perf_counter() - started)
+        feed = summarize(latencies, sum(latencies))
+        db.session.rollback()
+
+    results = {
+        "gigs": index.documents,
+        "terms": len(index.vocabulary),
+        "postings": len(index.postings),
+        "index_mb": round(index_bytes(index) / 1e6, 1),
+        "build_sec": round(build_sec, 2),
+        "top_k": top_k,
+        "feed": feed,
+    }
+    print("%s gigs, %s terms, %s postings, %.1f MB, built in %.2fs" % (
+        results["gigs"], results["terms"], results["postings"], results["index_mb"], results["build_sec"]))
+    for name in ("top_k", "feed"):
+        print("%-6s p50 %7.2fms  p95 %7.2fms  p99 %7.2fms" % (name, results[name]["p50_ms"], results[name]["p95_ms"], results[name]["p99_ms"]))
+    write_results(args.output, "recommend", {args.size: results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Route-level load benchmark.
+
+Seeds SQLite databases of several sizes (kept in benchmarks/.data and reused),
+drives the main routes with logged-in test clients and reports latency
+percentiles, throughput and SQL queries per request:
+
+    python benchmarks/bench_routes.py --sizes 1k 100k --requests 200 --output bench.json
+    python benchmarks/bench_routes.py --sizes 1k --compare bench.json
+"""
+import argparse
+import itertools
+import time
+
+from common import (SIZES, make_app, ensure_seeded, sample_users, sample_gig_slugs, counting_queries,
+                    login, summarize, write_results, compare, PASSWORD)
+
+
+def route_cases(app):
+    musician_email, employer_email, employer_username = sample_users(app)
+    slugs = itertools.cycle(sample_gig_slugs(app))
+
+    musician = login(app.test_client(), musician_email)
+    employer = login(app.test_client(), employer_email)
+    anonymous = app.test_client()
+
+    return {
+        "main.home (musician)": lambda: musician.get("/"),
+        "main.home (employer)": lambda: employer.get("/"),
+        "gig.show": lambda: musician.get("/gig/info/" + next(slugs)),
+        "gig.my_gigs": lambda: musician.get("/gig/my_gigs"),
+        "account.show": lambda: musician.get("/user/profile/" + employer_username),
+        "gig.dashboard": lambda: employer.get("/gig/dashboard"),
+        "auth.login": lambda: anonymous.post("/login", data=dict(email=musician_email, password=PASSWORD)),
+        "gig.apply_to_gig": lambda: musician.post("/gig/apply/" + next(slugs), headers={"Referer": "/"}),
+    }
+
+
+def run_case(app, request, count, warmup):
+    for _ in range(warmup):
+        request()
+    latencies = []
+    with counting_queries(app) as counter:
+        started = time.perf_counter()
+        for _ in range(count):
+            before = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - before)
+            assert response.status_code < 400, response.status
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, counter.count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["1k", "100k", "1m"], choices=sorted(SIZES))
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", default="bench_routes.json")
+    parser.add_argument("--compare", help="previous result file to compare p50 latency against")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        app = make_app(size)
+        ensure_seeded(app, size)
+        results[size] = {}
+        for name, request in route_cases(app).items():
+            stats = run_case(app, request, args.requests, args.warmup)
+            results[size][name] = stats
+            print("%-6s %-24s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %8.1f req/s  %5.1f queries" % (
+                size, name, stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["throughput_rps"],
+                stats["queries_per_request"]))
+
+    write_results(args.output, "routes", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Concurrent read/write load on SQLite: default rollback journal against the production profile.
+
+Every profile runs on its own copy of the seeded database. Reader processes browse the
+gig feed and gig pages as a musician while writer processes post new gigs as employers,
+and the benchmark reports operations per second and "database is locked" failures:
+
+    python benchmarks/bench_sqlite.py --size 100k --readers 6 --writers 2 --seconds 10 --output bench_sqlite.json
+"""
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from common import SIZES, make_app, ensure_seeded, database_path, sample_gig_slugs, login, summarize, write_results
+from app import db
+from app.models import User, Role
+
+PROFILES = {
+    "default": dict(SQLITE_PROFILE=None),
+    "production": dict(SQLITE_PROFILE="production", SQLITE_READ_ONLY_ROUTING=False),
+    "production + read-only routing": dict(SQLITE_PROFILE="production", SQLITE_READ_ONLY_ROUTING=True),
+}
+
+
+def worker(database, profile, role, index, slugs, deadline, results):
+    logging.disable(logging.CRITICAL) # locked requests log a traceback each
+    app = make_app("sqlite", SQLALCHEMY_DATABASE_URI="sqlite:///" + database, **PROFILES[profile])
+    with app.app_context():
+        role_id = Role.EMPLOYER if role == "writer" else Role.MUSICIAN
+        email = User.query.filter_by(role_id=role_id).order_by(User.id).offset(index).first().email
+        db.session.remove()
+    client = login(app.test_client(), email)
+
+    if role == "writer":
+        counter = itertools.count()
+        request = lambda: client.post("/gig/create", data=dict(title="Benchmark gig %d %d" % (index, next(counter)),
+                                                               description="Posted by the SQLite benchmark",
+                                                               payment=300, location="Paris"))
+    else:
+        pages = itertools.cycle(["/"] + ["/gig/info/" + slug for slug in slugs])
+        request = lambda: client.get(next(pages))
+
+    latencies, locked = [], 0
+    while time.time() < deadline:
+        before = time.perf_counter()
+        try:
+            response = request()
+            failed = response.status_code >= 500
+        except Exception as e:
+            failed = "locked" in str(e)
+            if not failed:
+                raise
+        if failed:
+            locked += 1
+        else:
+            latencies.append(time.perf_counter() - before)
+    results.put((role, latencies, locked))
+
+
+def run_profile(source, profile, readers, writers, seconds, slugs):
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "bench.sqlite")
+    shutil.copyfile(source, database)
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + seconds + 2 # leaves every process time to start and log in
+    workers = [multiprocessing.Process(target=worker, args=(database, profile, role, index, slugs, deadline, results))
+               for role, count in (("reader", readers), ("writer", writers)) for index in range(count)]
+    for process in workers:
+        process.start()
+    collected = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    shutil.rmtree(directory)
+
+    report = {}
+    for role in ("reader", "writer"):
+        latencies = [latency for name, values, _ in collected if name == role for latency in values]
+        stats = summarize(latencies, seconds)
+        stats["locked_errors"] = sum(locked for name, _, locked in collected if name == role)
+        report[role + "s"] = stats
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="1k", choices=sorted(SIZES))
+    parser.add_argument("--readers", type=int, default=6)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--output", default="bench_sqlite.json")
+    args = parser.parse_args()
+
+    app = make_app(args.size)
+    ensure_seeded(app, args.size)
+    slugs = sample_gig_slugs(app)
+
+    results = {}
+    for profile in args.profiles:
+        results[profile] = report = run_profile(database_path(args.size), profile, args.readers, args.writers,
+                                                args.seconds, slugs)
+        for role, stats in report.items():
+            print("%-32s %-8s %9.1f ops/sec  p95 %8.2f ms  %5d locked" % (profile, role, stats["throughput_rps"],
+                                                                       stats["p95_ms"], stats["locked_errors"]))
+    write_results(args.output, "sqlite", {args.size: results})
+
+
+if __name__ == "__main__":
+    main()
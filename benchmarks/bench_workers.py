@@ -0,0 +1,153 @@
+"""Throughput of the gunicorn worker models on the seeded app.
+
+Starts `gunicorn wsgi:app` with gunicorn.conf.py once per worker class, on a copy of a
+seeded database, and drives it over HTTP with logged-in keep-alive clients:
+
+    python benchmarks/bench_workers.py --size 1k --workers 4 --clients 32 --seconds 10 --output bench_workers.json
+
+Worker classes whose package (gevent, eventlet) is not installed are skipped.
+"""
+import argparse
+import http.client
+import importlib.util
+import itertools
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from common import SIZES, PASSWORD, make_app, ensure_seeded, database_path, sample_users, sample_gig_slugs, summarize, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_CLASSES = ("sync", "gthread", "gevent", "eventlet")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(worker_class, workers, threads, database, port):
+    env = dict(os.environ,
+               GUNICORN_WORKER_CLASS=worker_class, GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND="127.0.0.1:%d" % port, GUNICORN_ACCESSLOG="", GUNICORN_MAX_REQUESTS="0",
+               FLASK_SQLALCHEMY_DATABASE_URI="sqlite:///" + database, FLASK_WTF_CSRF_ENABLED="false",
+               FLASK_MAIL_SUPPRESS_SEND="true", FLASK_RATELIMIT_ENABLED="false",
+               FLASK_SECRET_KEY=os.getenv("FLASK_SECRET_KEY") or "benchmark-secret-key")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(process.stderr.read().decode())
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+class Client():
+    def __init__(self, port, email):
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.cookie = ""
+        body = urlencode(dict(email=email, password=PASSWORD))
+        status = self.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+        assert status == 302, "login failed for " + email
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {}, Cookie=self.cookie, **{"Accept-Encoding": "gzip"})
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        response.read()
+        cookies = SimpleCookie()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookies.load(header)
+        if "session" in cookies:
+            self.cookie = "session=" + cookies["session"].value
+        return response.status
+
+
+def drive(port, email, paths, deadline, latencies, errors):
+    client = Client(port, email)
+    for path in itertools.cycle(paths):
+        if time.time() >= deadline:
+            break
+        before = time.perf_counter()
+        try:
+            status = client.request("GET", path)
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            client = Client(port, email)
+            continue
+        if status >= 400:
+            errors.append(path)
+        else:
+            latencies.append(time.perf_counter() - before)
+
+
+def bench(worker_class, args, database, email, paths):
+    port = free_port()
+    process = start_gunicorn(worker_class, args.workers, args.threads, database, port)
+    try:
+        latencies, errors = [], []
+        deadline = time.time() + args.seconds
+        clients = [threading.Thread(target=drive, args=(port, email, paths[i:] + paths[:i], deadline, latencies, errors))
+                   for i in range(args.clients)]
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        stats = summarize(latencies, time.perf_counter() - started)
+        stats["errors"] = len(errors)
+        return stats
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="1k", choices=sorted(SIZES))
+    parser.add_argument("--worker-classes", nargs="+", default=list(WORKER_CLASSES), choices=WORKER_CLASSES)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="threads per gthread worker")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent keep-alive HTTP clients")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--output", default="bench_workers.json")
+    args = parser.parse_args()
+
+    app = make_app(args.size)
+    ensure_seeded(app, args.size)
+    musician_email, _, _ = sample_users(app)
+    paths = ["/", "/api/gigs"] + ["/gig/info/" + slug for slug in sample_gig_slugs(app, 20)]
+
+    results = {}
+    for worker_class in args.worker_classes:
+        if worker_class in ("gevent", "eventlet") and importlib.util.find_spec(worker_class) is None:
+            print("%-10s skipped, %s is not installed" % (worker_class, worker_class))
+            continue
+        directory = tempfile.mkdtemp()
+        database = os.path.join(directory, "bench.sqlite")
+        shutil.copyfile(database_path(args.size), database)
+        try:
+            results[worker_class] = stats = bench(worker_class, args, database, musician_email, paths)
+        finally:
+            shutil.rmtree(directory)
+        print("%-10s %8.1f req/sec  p50 %7.2f ms  p95 %7.2f ms  %d errors" % (
+            worker_class, stats["throughput_rps"], stats["p50_ms"], stats["p95_ms"], stats["errors"]))
+    write_results(args.output, "workers", {args.size: results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Helpers shared by the benchmark scripts: seeded databases, query counting and latency stats."""
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Gig, Role
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+PASSWORD = "password123"
+
+SIZES = {
+    "1k": dict(num_of_employers=50, num_of_gigs=1000, num_of_musicians=500, num_of_applications=5),
+    "100k": dict(num_of_employers=2000, num_of_gigs=100000, num_of_musicians=20000, num_of_applications=5),
+    "1m": dict(num_of_employers=10000, num_of_gigs=1000000, num_of_musicians=100000, num_of_applications=5),
+}
+
+
+def database_path(size):
+    return os.path.join(DATA_DIR, "globomantics-%s.sqlite" % size)
+
+
+def make_app(size, **config):
+    settings = dict(
+        SQLALCHEMY_DATABASE_URI="sqlite:///" + database_path(size),
+        WTF_CSRF_ENABLED=False,
+        SEND_MAILS_WITH_CELERY=False,
+        MAIL_SUPPRESS_SEND=True,
+        RATELIMIT_ENABLED=False, # benchmark clients log in from one address
+        DEBUG=False
+    )
+    settings.update(config)
+    return create_app(settings)
+
+
+def ensure_seeded(app, size, seed=1):
+    """Seeds the database for `size` once; later runs reuse the file."""
+    from app.seed import seed_db
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with app.app_context():
+        db.create_all()
+        if Gig.query.first() is None:
+            seed_db(seed=seed, **SIZES[size])
+
+
+def sample_users(app):
+    with app.app_context():
+        musician = User.query.filter_by(role_id=Role.MUSICIAN).first()
+        employer = User.query.filter_by(role_id=Role.EMPLOYER).first()
+        return musician.email, employer.email, employer.username
+
+
+def sample_gig_slugs(app, count=200):
+    with app.app_context():
+        last_id = db.session.query(db.func.max(Gig.id)).scalar()
+        step = max(last_id // count, 1)
+        return [slug for slug, in db.session.query(Gig.slug).filter(Gig.id % step == 0).limit(count)]
+
+
+class QueryCounter():
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+@contextmanager
+def counting_queries(app):
+    counter = QueryCounter()
+    with app.app_context():
+        engine = db.get_engine(app)
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+def login(client, email):
+    response = client.post("/login", data=dict(email=email, password=PASSWORD))
+    assert response.status_code == 302, "login failed for " + email
+    return client
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, queries=None):
+    summary = {
+        "requests": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+    if queries is not None:
+        summary["queries_per_request"] = round(queries / len(latencies), 2) if latencies else 0.0
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, name, results):
+    report = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results written to " + path)
+    return report
+
+
+def compare(previous_path, results, metric="p50_ms"):
+    """Prints the relative change of `metric` against a previous result file."""
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+    for size, routes in results.items():
+        for route, stats in routes.items():
+            before = previous.get(size, {}).get(route, {}).get(metric)
+            if before:
+                change = (stats[metric] - before) / before * 100
+                print("%-6s %-28s %10.3f -> %10.3f (%+.1f%%)" % (size, route, before, stats[metric], change))
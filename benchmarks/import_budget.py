@@ -0,0 +1,95 @@
+"""Import-time report for app startup, checked against a budget.
+
+Boots the app in fresh interpreters under `python -X importtime`, reports the median
+wall time and the packages that take longest to import, and fails (exit status 1) when startup is
+over budget or a subsystem that should load lazily was imported:
+
+    python benchmarks/import_budget.py --budget-ms 500 --output import_budget.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from common import write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "create_app": "from app import create_app; create_app()",
+    "wsgi": "import wsgi",
+}
+
+# Only needed once a mail is queued on Celery, a mail is sent, the database is seeded or gigs are recommended
+LAZY_MODULES = ("celery", "kombu", "flask_mail", "smtplib", "faker", "numpy")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+%s
+elapsed = time.perf_counter() - started
+print(json.dumps({"ms": elapsed * 1000, "modules": sorted(sys.modules)}))
+"""
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$")
+
+
+def run(statement):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE % statement], cwd=ROOT,
+                            capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1",
+                                     FLASK_SECRET_KEY=os.getenv("FLASK_SECRET_KEY") or "import-budget")) # wsgi.py requires one
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match: # self time summed per top-level package
+            package = match.group(2).split(".")[0]
+            packages[package] = packages.get(package, 0) + int(match.group(1)) / 1000
+    return probe, packages
+
+
+def report(statement, repeat):
+    runs = [run(statement) for _ in range(repeat)]
+    modules = set(runs[0][0]["modules"])
+    slowest = {}
+    for name in runs[0][1]:
+        slowest[name] = round(statistics.median(packages.get(name, 0) for _, packages in runs), 2)
+    return {
+        "wall_ms": round(statistics.median(probe["ms"] for probe, _ in runs), 2),
+        "imports": len(modules),
+        "lazy_modules_imported": [name for name in LAZY_MODULES if name in modules],
+        "slowest_packages_ms": dict(sorted(slowest.items(), key=lambda item: -item[1])[:15]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=500, help="median startup wall time allowed per target")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="import_budget.json")
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for target, statement in TARGETS.items():
+        results[target] = stats = report(statement, args.repeat)
+        print("%s: %.1f ms, %d modules" % (target, stats["wall_ms"], stats["imports"]))
+        for name, ms in stats["slowest_packages_ms"].items():
+            print("    %-28s %8.2f ms" % (name, ms))
+        if stats["wall_ms"] > args.budget_ms:
+            failures.append("%s took %.1f ms, over the %.0f ms budget" % (target, stats["wall_ms"], args.budget_ms))
+        if stats["lazy_modules_imported"]:
+            failures.append("%s imported %s at startup" % (target, ", ".join(stats["lazy_modules_imported"])))
+    write_results(args.output, "import_budget", {"budget_ms": args.budget_ms, "targets": results})
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Gunicorn settings, read from the working directory by `gunicorn wsgi:app`.
+
+GUNICORN_WORKER_CLASS picks the worker model:
+  sync     one request at a time per process
+  gthread  GUNICORN_THREADS threads per process (default, the best fit for SQLite)
+  gevent / eventlet
+           GUNICORN_WORKER_CONNECTIONS green threads per process, for slow clients and
+           SMTP or Redis I/O. SQLite calls don't yield, so they still run one at a time.
+"""
+import multiprocessing
+import os
+
+worker_class        = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers             = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads             = int(os.getenv("GUNICORN_THREADS", 4))
+worker_connections  = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+bind                = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "8000"))
+timeout             = int(os.getenv("GUNICORN_TIMEOUT", 30))
+keepalive           = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests        = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000)) # recycles workers to bound memory growth
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+accesslog           = os.getenv("GUNICORN_ACCESSLOG", "-") or None # an empty value turns it off
+
+# The app is imported once in the master and forked, workers share its memory and boot faster
+preload_app = True
+
+# Green workers patch the standard library when they start, which with preload_app is after the app
+# (its locks, queues and connection pools) was imported. Patch before that happens instead.
+if worker_class == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+elif worker_class == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+
+
+def post_fork(server, worker):
+    # connections opened in the master while preloading must not be shared between processes
+    from wsgi import app
+    from app import db
+    with app.app_context():
+        db.dispose(app)
+
+
+def when_ready(server):
+    # runs in the master before the first fork, so workers, recycled ones too, share one recommendation
+    # index instead of each building its own
+    from wsgi import app
+    if app.config["RECOMMEND_PRELOAD"]:
+        from app.recommend import recommender
+        with app.app_context():
+            recommender.index(app, wait=True)
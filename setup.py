@@ -1,10 +1,21 @@
-from app import create_app, db, celery
+from app import create_app, db, get_celery
 from app.models import User
 from flask_migrate import Migrate
 from app.seed import seed_db
 
+def include_object(object, name, type_, reflected, compare_to):
+    # the gigs_fts index and its FTS5 shadow tables come from GIG_SEARCH_DDL, not the models,
+    # autogenerate would otherwise drop them
+    return not (type_ == "table" and name.startswith("gigs_fts"))
+
 app = create_app()
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, include_object=include_object)
+
+def __getattr__(name):
+    # `celery -A setup.celery worker` still finds the Celery app, other commands never import Celery
+    if name == "celery":
+        return get_celery(app)
+    raise AttributeError(name)
 
 @app.shell_context_processor
 def make_shell_context():
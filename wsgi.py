@@ -0,0 +1,30 @@
+"""Production entry point, served with `gunicorn wsgi:app` (settings in gunicorn.conf.py).
+
+Production defaults are set here and every setting can still be overridden with a
+FLASK_<KEY> environment variable, e.g. FLASK_SECRET_KEY or FLASK_SQLALCHEMY_DATABASE_URI.
+"""
+import os
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app import create_app
+
+# The development key is committed to the repository, anyone could sign a session with it
+if not os.getenv("FLASK_SECRET_KEY"):
+    raise RuntimeError("Set FLASK_SECRET_KEY to a long random value, e.g. python -c \"import secrets; print(secrets.token_urlsafe(32))\"")
+
+app = create_app({
+    "DEBUG": False,
+    "SQLITE_PROFILE": "production",
+    "SEND_MAILS_WITH_CELERY": False,
+    "MAIL_DISPATCH": "thread",
+    "RECOMMEND_PRELOAD": True,
+    # the current user cache is per worker and only the worker making a change clears it, so role,
+    # activation and deleted account changes reach the other workers this late. Raise it together with
+    # FLASK_CURRENT_USER_CACHE_BACKEND=redis, which all workers share
+    "CURRENT_USER_CACHE_SECONDS": 5,
+    "PROXY_COUNT": 1, # the Procfile deployment's router, FLASK_PROXY_COUNT=0 when clients connect directly
+})
+
+# Behind the router the client address is the proxy's, and the rate limiter would put every client in
+# one bucket. Trust the X-Forwarded-For and -Proto headers set by PROXY_COUNT proxies.
+if app.config["PROXY_COUNT"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_COUNT"], x_proto=app.config["PROXY_COUNT"])